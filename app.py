@@ -12,7 +12,11 @@ import cv2
 import sqlite3
 import threading
 import time
+import queue
+import logging
+import logging.handlers
 import pickle
+from collections import deque
 import pandas as pd
 import numpy as np
 
@@ -37,6 +41,27 @@ CORS(app)
 import secrets
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', secrets.token_hex(32))
 app.config['JSON_SORT_KEYS'] = False
+# Run emotion inference in a separate process (frames shared via shared memory)
+app.config['EMOTION_WORKER_PROCESS'] = os.environ.get('EMOTION_WORKER_PROCESS', '0') == '1'
+API_VERSION = '1.0.0'
+
+# True when multiprocessing (spawn) re-imports this file inside a worker process;
+# such imports must not load models or open the Arduino serial port
+IS_SPAWNED_WORKER = __name__ == '__mp_main__'
+
+# =========================
+# Logging
+# =========================
+
+# Frame and sync threads only enqueue log records; a single listener thread
+# does the terminal I/O so hot paths never block on the stdout lock.
+log = logging.getLogger('smartclassroom')
+log.setLevel(logging.INFO)
+log.propagate = False
+_log_queue = queue.Queue(-1)
+log.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+_log_listener.start()
 
 # =========================
 # Gradient Boosting Model Loading
@@ -59,34 +84,35 @@ def load_ml_models():
         # Load Gradient Boosting model
         with open(os.path.join(model_dir, 'gb_model_with_complementing.pkl'), 'rb') as f:
             gb_model = pickle.load(f)
-        print("[ML] ✓ Gradient Boosting model loaded")
+        log.info("[ML] ✓ Gradient Boosting model loaded")
         
         # Load Random Forest model
         with open(os.path.join(model_dir, 'rf_model_with_complementing.pkl'), 'rb') as f:
             rf_model = pickle.load(f)
-        print("[ML] ✓ Random Forest model loaded")
+        log.info("[ML] ✓ Random Forest model loaded")
         
         # Load scaler
         with open(os.path.join(model_dir, 'gb_scaler.pkl'), 'rb') as f:
             gb_scaler = pickle.load(f)
-        print("[ML] ✓ Scaler loaded")
+        log.info("[ML] ✓ Scaler loaded")
         
         # Load feature columns
         with open(os.path.join(model_dir, 'feature_columns.pkl'), 'rb') as f:
             feature_columns = pickle.load(f)
-        print(f"[ML] ✓ Feature columns loaded ({len(feature_columns)} features)")
+        log.info("[ML] ✓ Feature columns loaded (%d features)", len(feature_columns))
         
         models_loaded = True
-        print("[ML] ✓ All ML models loaded successfully")
+        log.info("[ML] ✓ All ML models loaded successfully")
         return True
         
     except Exception as e:
-        print(f"[ML] ✗ Failed to load ML models: {e}")
+        log.warning("[ML] ✗ Failed to load ML models: %s", e)
         models_loaded = False
         return False
 
 # Load models on startup
-load_ml_models()
+if not IS_SPAWNED_WORKER:
+    load_ml_models()
 
 # =========================
 # Feature Engineering Functions (from Emotion-b2.py)
@@ -682,6 +708,8 @@ def export_iot_log_csv():
 @app.route('/api/iot/list-databases', methods=['GET'])
 def list_iot_databases():
     """List all available IoT database files"""
+    from camera_system.iot_sensor import get_session_record_count
+    
     try:
         data_dir = 'data'
         if not os.path.exists(data_dir):
@@ -700,9 +728,7 @@ def list_iot_databases():
                 # Try to get record count
                 try:
                     conn = sqlite3.connect(filepath)
-                    cursor = conn.cursor()
-                    cursor.execute('SELECT COUNT(*) FROM sensor_data')
-                    record_count = cursor.fetchone()[0]
+                    record_count = get_session_record_count(conn)
                     conn.close()
                 except:
                     record_count = 0
@@ -1100,15 +1126,17 @@ def get_alerts():
 try:
     from camera_system import CameraDetector, CameraStream
     from camera_system.emotion_detector import EmotionDetector
+    from camera_system.emotion_worker import EmotionWorkerProcess
     from camera_system.iot_sensor import initialize_iot, get_iot_data, get_iot_status, get_iot_alerts
     CAMERA_SYSTEM_AVAILABLE = True
-    print("✓ Camera system loaded successfully")
+    log.info("✓ Camera system loaded successfully")
 except ImportError as e:
-    print(f"Warning: Camera system not available: {e}")
+    log.warning("Warning: Camera system not available: %s", e)
     CAMERA_SYSTEM_AVAILABLE = False
     CameraDetector = None
     CameraStream = None
     EmotionDetector = None
+    EmotionWorkerProcess = None
     initialize_iot = None
     get_iot_data = None
     get_iot_status = None
@@ -1117,6 +1145,8 @@ except ImportError as e:
 # Global camera stream instance and emotion detector
 active_camera_stream = None
 emotion_detector = None
+emotion_worker = None
+emotion_worker_lock = threading.Lock()  # Guards starting, replacing and stopping emotion_worker
 iot_enabled = False
 cv_data_sync_thread = None
 cv_data_sync_running = False
@@ -1132,34 +1162,43 @@ current_emotion_stats = {
 emotion_history = []
 last_emotion_snapshot = time.time()
 
+# Ring buffer of (time, faces) per emotion snapshot; the IoT sync stores the
+# windowed max instead of whatever the face count happened to be at sync time
+presence_window = deque(maxlen=120)
+PRESENCE_SYNC_WINDOW = 10  # seconds, matches the CV sync interval
+
 def cv_data_sync_worker():
     """Background worker to sync CV data to IoT sensor every 10 seconds"""
     global cv_data_sync_running, current_emotion_stats, classroom_data
     from camera_system.iot_sensor import iot_sensor
     
-    print("[CV Sync] Background worker started - syncing every 10 seconds")
+    current_stats_get = classroom_data['current_stats'].get
+    
+    log.info("[CV Sync] Background worker started - syncing every 10 seconds")
     
     while cv_data_sync_running:
         try:
             # Only sync if IoT logging is enabled
             if iot_enabled and iot_sensor and iot_sensor.db_logging_enabled:
-                # Get current CV data
-                occupancy = classroom_data['current_stats'].get('studentsDetected', 0)
+                # Get current CV data (peak face count over the last sync window)
+                window_start = time.time() - PRESENCE_SYNC_WINDOW
+                recent_faces = [faces for t, faces in list(presence_window) if t >= window_start]
+                occupancy = max(recent_faces) if recent_faces else current_stats_get('studentsDetected', 0)
                 # Use emotion COUNTS (not percentages) - each face contributes 1 to its dominant emotion
                 emotion_counts = current_emotion_stats.get('emotions', {})
                 
                 # Update IoT sensor with CV data (counts, not percentages)
                 iot_sensor.update_cv_data(occupancy, emotion_counts)
                 
-                print(f"[CV Sync] Updated IoT with occupancy={occupancy}, emotion_counts={emotion_counts}")
+                log.debug("[CV Sync] Updated IoT with occupancy=%s, emotion_counts=%s", occupancy, emotion_counts)
             
         except Exception as e:
-            print(f"[CV Sync] Error syncing data: {e}")
+            log.warning("[CV Sync] Error syncing data: %s", e)
         
         # Wait 10 seconds before next sync
         time.sleep(10)
     
-    print("[CV Sync] Background worker stopped")
+    log.info("[CV Sync] Background worker stopped")
 
 def start_cv_data_sync():
     """Start the CV data sync background thread"""
@@ -1171,7 +1210,7 @@ def start_cv_data_sync():
     cv_data_sync_running = True
     cv_data_sync_thread = threading.Thread(target=cv_data_sync_worker, daemon=True)
     cv_data_sync_thread.start()
-    print("[CV Sync] Started background sync thread")
+    log.info("[CV Sync] Started background sync thread")
 
 def stop_cv_data_sync():
     """Stop the CV data sync background thread"""
@@ -1180,17 +1219,17 @@ def stop_cv_data_sync():
     cv_data_sync_running = False
     if cv_data_sync_thread:
         cv_data_sync_thread.join(timeout=2)
-    print("[CV Sync] Stopped background sync thread")
+    log.info("[CV Sync] Stopped background sync thread")
 
 # Initialize IoT sensors (optional - won't fail if not available)
-if CAMERA_SYSTEM_AVAILABLE and initialize_iot:
+if CAMERA_SYSTEM_AVAILABLE and initialize_iot and not IS_SPAWNED_WORKER:
     # Try to initialize IoT sensors on COM5 at 9600 baud
-    print("[IoT] Attempting to connect to Arduino on COM5 at 9600 baud...")
+    log.info("[IoT] Attempting to connect to Arduino on COM5 at 9600 baud...")
     iot_enabled = initialize_iot(port='COM5', baudrate=9600)  # Explicitly use COM5 at 9600 baud
     if not iot_enabled:
-        print("ℹ IoT sensors not connected (system will work without them)")
-        print("ℹ Make sure Arduino IDE Serial Monitor is CLOSED")
-        print("ℹ If Arduino is on different port, edit app.py line 937")
+        log.info("ℹ IoT sensors not connected (system will work without them)")
+        log.info("ℹ Make sure Arduino IDE Serial Monitor is CLOSED")
+        log.info("ℹ If Arduino is on different port, edit app.py line 937")
 
 @app.route('/api/camera/detect', methods=['GET'])
 def detect_cameras():
@@ -1204,18 +1243,18 @@ def detect_cameras():
         }), 200
     
     try:
-        print("\n" + "="*60)
-        print("Starting camera detection...")
-        print("="*60)
+        log.info("=" * 60)
+        log.info("Starting camera detection...")
+        log.info("=" * 60)
         
         detector = CameraDetector()
         cameras = detector.detect_cameras()
         system_info = detector.get_system_info()
         
-        print(f"Detection complete. Found {len(cameras)} camera(s)")
+        log.info("Detection complete. Found %d camera(s)", len(cameras))
         for cam in cameras:
-            print(f"  - Camera {cam['id']}: {cam['name']} ({cam['resolution']})")
-        print("="*60 + "\n")
+            log.info("  - Camera %s: %s (%s)", cam['id'], cam['name'], cam['resolution'])
+        log.info("=" * 60)
         
         return jsonify({
             'success': True,
@@ -1224,9 +1263,7 @@ def detect_cameras():
             'count': len(cameras)
         }), 200
     except Exception as e:
-        print(f"Camera detection error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("Camera detection error: %s", e)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -1286,19 +1323,25 @@ def start_camera():
         if active_camera_stream:
             active_camera_stream.stop()
         
-        # Initialize emotion detector if not already created
-        if emotion_detector is None and EmotionDetector is not None:
+        # Initialize emotion detector if not already created (worker mode loads it in the worker process)
+        if emotion_detector is None and EmotionDetector is not None and not app.config['EMOTION_WORKER_PROCESS']:
             try:
                 emotion_detector = EmotionDetector()
-                print("✓ Emotion detector initialized")
+                log.info("✓ Emotion detector initialized")
             except Exception as e:
-                print(f"⚠ Warning: Could not initialize emotion detector: {e}")
+                log.warning("⚠ Warning: Could not initialize emotion detector: %s", e)
         
         # Start new stream
         active_camera_stream = CameraStream(camera_id)
         success = active_camera_stream.start()
         
         if success:
+            # Worker mode: start (or reuse) the worker process here, sized to the camera's frames
+            if app.config['EMOTION_WORKER_PROCESS'] and EmotionWorkerProcess is not None:
+                frame = active_camera_stream.read_frame()
+                if frame is not None and not _start_emotion_worker(frame.shape):
+                    _fall_back_to_in_process_detector()
+            
             return jsonify({
                 'success': True,
                 'camera_id': camera_id,
@@ -1319,13 +1362,18 @@ def start_camera():
 @app.route('/api/camera/stop', methods=['POST'])
 def stop_camera():
     """Stop active camera stream"""
-    global active_camera_stream, current_emotion_stats
+    global active_camera_stream, current_emotion_stats, emotion_worker
     
     try:
         if active_camera_stream:
             active_camera_stream.stop()
             active_camera_stream = None
         
+        with emotion_worker_lock:
+            if emotion_worker:
+                emotion_worker.stop()
+                emotion_worker = None
+        
         # Reset emotion stats
         current_emotion_stats = {
             'total_faces': 0,
@@ -1352,24 +1400,51 @@ def stop_camera():
         }), 500
 
 
+def _not_modified(etag):
+    """Return an empty 304 response if the client already holds this ETag, else None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.max_age = 1
+        return response
+    return None
+
+
+def _with_etag(response, etag):
+    """Attach ETag and a short max-age to a JSON response"""
+    response.set_etag(etag)
+    response.cache_control.max_age = 1
+    return response
+
+
 @app.route('/api/camera/status', methods=['GET'])
 def camera_status():
-    """Get current camera stream status"""
+    """Get current camera stream status (supports If-None-Match / 304)"""
     global active_camera_stream
     
     try:
         if active_camera_stream and active_camera_stream.is_running:
-            return jsonify({
+            # fps is part of the body, so it must be part of the validator too
+            fps = round(active_camera_stream.fps)
+            etag = f'camera-{active_camera_stream.camera_id}-running-{fps}'
+            cached = _not_modified(etag)
+            if cached:
+                return cached
+            return _with_etag(jsonify({
                 'success': True,
                 'active': True,
                 'camera_id': active_camera_stream.camera_id,
-                'fps': active_camera_stream.fps
-            }), 200
+                'fps': fps
+            }), etag)
         else:
-            return jsonify({
+            etag = 'camera-idle'
+            cached = _not_modified(etag)
+            if cached:
+                return cached
+            return _with_etag(jsonify({
                 'success': True,
                 'active': False
-            }), 200
+            }), etag)
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1377,14 +1452,49 @@ def camera_status():
         }), 500
 
 
-def generate_frames():
+# Multipart framing for the MJPEG stream
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_TRAILER = b'\r\n'
+
+
+def _generate_frames_raw():
+    """Generator function to stream video frames without emotion detection (camera-only mode)"""
+    while True:
+        # Check if camera is still active
+        if not active_camera_stream or not active_camera_stream.is_running:
+            log.info("Camera stream stopped, ending frame generation")
+            break
+            
+        try:
+            frame = active_camera_stream.read_frame()
+            
+            if frame is not None:
+                # Encode frame as JPEG
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if ret:
+                    yield b''.join((MJPEG_PART_HEADER, buffer, MJPEG_PART_TRAILER))
+            else:
+                log.info("No frame received from camera")
+                break
+        except Exception as e:
+            log.error("Error generating frame: %s", e)
+            break
+
+
+def _generate_frames_with_emotion():
     """Generator function to stream video frames with emotion detection"""
-    global active_camera_stream, emotion_detector, current_emotion_stats
+    global current_emotion_stats, last_emotion_snapshot
+    
+    # Bind per-frame callables once instead of re-resolving attributes every frame
+    process_frame = emotion_detector.process_frame
+    get_engagement = emotion_detector.get_engagement_from_emotions
+    current_stats = classroom_data['current_stats']
+    emotion_error_count = 0
     
     while True:
         # Check if camera is still active
         if not active_camera_stream or not active_camera_stream.is_running:
-            print("Camera stream stopped, ending frame generation")
+            log.info("Camera stream stopped, ending frame generation")
             break
             
         try:
@@ -1392,53 +1502,198 @@ def generate_frames():
             
             if frame is not None:
                 # Process frame with emotion detection
-                if emotion_detector:
-                    try:
-                        annotated_frame, emotion_stats = emotion_detector.process_frame(frame)
+                try:
+                    annotated_frame, emotion_stats = process_frame(frame)
+                    
+                    # Update global emotion stats
+                    engagement = get_engagement()
+                    emotion_stats['engagement'] = engagement
+                    current_emotion_stats = emotion_stats
+                    
+                    # Update classroom data with emotion-based stats
+                    current_stats['studentsDetected'] = emotion_stats['total_faces']
+                    current_stats['avgEngagement'] = int(engagement)
+                    
+                    # Store emotion snapshot every second for analytics
+                    current_time = time.time()
+                    if current_time - last_emotion_snapshot >= 1.0:  # Store every 1 second
+                        emotion_snapshot = {
+                            'timestamp': datetime.now().isoformat(),
+                            'total_faces': emotion_stats['total_faces'],
+                            'emotion_percentages': emotion_stats['emotion_percentages'].copy(),
+                            'engagement': engagement
+                        }
+                        emotion_history.append(emotion_snapshot)
+                        presence_window.append((current_time, emotion_stats['total_faces']))
                         
-                        # Update global emotion stats
+                        # No limit on emotion history for long sessions (3-4 hours)
+                        # Memory usage: ~1KB per snapshot = ~14.4MB for 4 hours
+                        
+                        last_emotion_snapshot = current_time
+                    
+                    frame = annotated_frame
+                except Exception as e:
+                    # Sample the error path: a failing model would otherwise log every frame
+                    if (emotion_error_count & 63) == 0:
+                        log.warning("Error in emotion detection (%d occurrences): %s", emotion_error_count + 1, e)
+                    emotion_error_count += 1
+                
+                # Encode frame as JPEG
+                ret, buffer = cv2.imencode('.jpg', frame)
+                if ret:
+                    # Yield frame in multipart format, joining straight from the
+                    # encoder's buffer (no tobytes() copy or intermediate concatenations)
+                    yield b''.join((MJPEG_PART_HEADER, buffer, MJPEG_PART_TRAILER))
+            else:
+                log.info("No frame received from camera")
+                break
+        except Exception as e:
+            log.error("Error generating frame: %s", e)
+            break
+
+
+def _start_emotion_worker(frame_shape):
+    """
+    Start the emotion worker process for a camera stream (called from start_camera only)
+    
+    A running worker for the same frame shape is reused; otherwise it is replaced.
+    
+    Returns:
+        True if a worker is running for frame_shape
+    """
+    global emotion_worker
+    
+    with emotion_worker_lock:
+        if emotion_worker and emotion_worker.frame_shape == tuple(frame_shape) and emotion_worker.is_alive():
+            return True
+        if emotion_worker:
+            emotion_worker.stop()
+            emotion_worker = None
+        try:
+            emotion_worker = EmotionWorkerProcess(frame_shape)
+            log.info("✓ Emotion worker process started for %sx%s frames", frame_shape[1], frame_shape[0])
+            return True
+        except Exception as e:
+            log.warning("⚠ Warning: Could not start emotion worker process: %s", e)
+            return False
+
+
+def _fall_back_to_in_process_detector(dead_worker=None):
+    """Stop a dead emotion worker and load the detector in this process instead"""
+    global emotion_worker, emotion_detector
+    
+    with emotion_worker_lock:
+        if dead_worker is not None and emotion_worker is dead_worker:
+            dead_worker.stop()
+            emotion_worker = None
+        if emotion_detector is None and EmotionDetector is not None:
+            try:
+                emotion_detector = EmotionDetector()
+                log.info("✓ Emotion detector initialized in-process")
+            except Exception as e:
+                log.warning("⚠ Warning: Could not initialize emotion detector: %s", e)
+    return emotion_detector is not None
+
+
+# How long the last annotated frame keeps being shown while the worker is busy;
+# past this (worker loading or stalled) the raw camera frame is streamed instead
+WORKER_STALE_FRAME_SECONDS = 1.0
+
+
+def _generate_frames_with_worker():
+    """
+    Generator function to stream video frames with emotion detection in a worker process
+    
+    One frame is in flight at a time, shared by every client streaming the camera: while
+    the worker analyses frame N, this thread keeps capturing and streaming at camera rate,
+    showing the latest annotated result (or the raw frame if that result is stale). If the
+    worker process dies, the stream continues with in-process inference.
+    """
+    global current_emotion_stats, last_emotion_snapshot
+    
+    worker = emotion_worker
+    current_stats = classroom_data['current_stats']
+    emotion_error_count = 0
+    worker_died = False
+    
+    while True:
+        # Check if camera is still active
+        if not active_camera_stream or not active_camera_stream.is_running:
+            log.info("Camera stream stopped, ending frame generation")
+            break
+            
+        try:
+            frame = active_camera_stream.read_frame()
+            
+            if frame is None:
+                log.info("No frame received from camera")
+                break
+            
+            if frame.shape == worker.frame_shape:
+                try:
+                    # Never waits on the worker: the camera read already paces this loop
+                    result = worker.exchange(frame)
+                    if result is not None:
+                        emotion_stats = result[1]
+                        engagement = emotion_stats['engagement']
                         current_emotion_stats = emotion_stats
-                        current_emotion_stats['engagement'] = emotion_detector.get_engagement_from_emotions()
                         
                         # Update classroom data with emotion-based stats
-                        classroom_data['current_stats']['studentsDetected'] = emotion_stats['total_faces']
-                        classroom_data['current_stats']['avgEngagement'] = int(current_emotion_stats['engagement'])
+                        current_stats['studentsDetected'] = emotion_stats['total_faces']
+                        current_stats['avgEngagement'] = int(engagement)
                         
                         # Store emotion snapshot every second for analytics
-                        global last_emotion_snapshot, emotion_history
                         current_time = time.time()
-                        if current_time - last_emotion_snapshot >= 1.0:  # Store every 1 second
-                            emotion_snapshot = {
+                        if current_time - last_emotion_snapshot >= 1.0:
+                            emotion_history.append({
                                 'timestamp': datetime.now().isoformat(),
                                 'total_faces': emotion_stats['total_faces'],
                                 'emotion_percentages': emotion_stats['emotion_percentages'].copy(),
-                                'engagement': current_emotion_stats['engagement']
-                            }
-                            emotion_history.append(emotion_snapshot)
-                            
-                            # No limit on emotion history for long sessions (3-4 hours)
-                            # Memory usage: ~1KB per snapshot = ~14.4MB for 4 hours
-                            
+                                'engagement': engagement
+                            })
+                            presence_window.append((current_time, emotion_stats['total_faces']))
                             last_emotion_snapshot = current_time
-                        
-                        frame = annotated_frame
-                    except Exception as e:
-                        print(f"Error in emotion detection: {e}")
-                
-                # Encode frame as JPEG
-                ret, buffer = cv2.imencode('.jpg', frame)
-                if ret:
-                    frame_bytes = buffer.tobytes()
-                    
-                    # Yield frame in multipart format
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-            else:
-                print("No frame received from camera")
-                break
+                except RuntimeError as e:
+                    if not worker.is_alive():
+                        # stop_camera() stops the worker after clearing the stream; only a
+                        # worker that died under a live stream needs the fallback
+                        if active_camera_stream and active_camera_stream.is_running:
+                            log.warning("⚠ Emotion worker process exited, falling back to in-process detection")
+                            worker_died = True
+                        break
+                    if (emotion_error_count & 63) == 0:
+                        log.warning("Error in emotion detection (%d occurrences): %s", emotion_error_count + 1, e)
+                    emotion_error_count += 1
+            
+            output_frame = frame
+            last_annotated = worker.last_annotated
+            if (last_annotated is not None and last_annotated.shape == frame.shape and
+                    time.time() - worker.last_result_time < WORKER_STALE_FRAME_SECONDS):
+                output_frame = last_annotated
+            
+            # Encode frame as JPEG
+            ret, buffer = cv2.imencode('.jpg', output_frame)
+            if ret:
+                yield b''.join((MJPEG_PART_HEADER, buffer, MJPEG_PART_TRAILER))
         except Exception as e:
-            print(f"Error generating frame: {e}")
+            log.error("Error generating frame: %s", e)
             break
+    
+    if worker_died:
+        if _fall_back_to_in_process_detector(worker):
+            yield from _generate_frames_with_emotion()
+        else:
+            yield from _generate_frames_raw()
+
+
+def generate_frames():
+    """Pick the frame generator once per stream based on how emotion detection is available"""
+    # start_camera() starts the worker; it is cleared again if it dies or fails to start
+    if emotion_worker is not None:
+        return _generate_frames_with_worker()
+    if emotion_detector:
+        return _generate_frames_with_emotion()
+    return _generate_frames_raw()
 
 
 @app.route('/api/camera/stream')
@@ -1478,16 +1733,20 @@ def get_emotion_history():
             'time_range': 'No data'
         }), 200
     
-    # Calculate average emotion percentages
-    emotion_sums = {'Happy': 0, 'Surprise': 0, 'Neutral': 0, 'Sad': 0, 'Angry': 0, 'Disgust': 0, 'Fear': 0}
+    # Calculate average emotion percentages: pack snapshots into a (count, 7) array
+    # and reduce column-wise instead of summing dict entries one by one
+    emotions = ('Happy', 'Surprise', 'Neutral', 'Sad', 'Angry', 'Disgust', 'Fear')
     count = len(emotion_history)
     
-    for snapshot in emotion_history:
-        for emotion, value in snapshot['emotion_percentages'].items():
-            emotion_sums[emotion] += value
+    percentages = np.fromiter(
+        (snapshot['emotion_percentages'].get(emotion, 0)
+         for snapshot in emotion_history for emotion in emotions),
+        dtype=np.float64, count=count * len(emotions)
+    ).reshape(count, len(emotions))
+    means = percentages.mean(axis=0)
     
     # Calculate averages
-    average_emotions = {emotion: round(total / count, 1) for emotion, total in emotion_sums.items()}
+    average_emotions = {emotion: round(float(mean), 1) for emotion, mean in zip(emotions, means)}
     
     # Get time range
     start_time = emotion_history[0]['timestamp']
@@ -1583,7 +1842,7 @@ def get_forecast_prediction():
         # Check if all required feature columns exist
         missing_features = [col for col in feature_columns if col not in df_engineered.columns]
         if missing_features:
-            print(f"[ML] Warning: Missing features: {missing_features[:10]}...")  # Log first 10
+            log.warning("[ML] Warning: Missing features: %s...", missing_features[:10])  # Log first 10
             return jsonify({
                 'success': False,
                 'error': f'Feature engineering produced missing columns ({len(missing_features)} missing)',
@@ -1699,9 +1958,7 @@ def get_forecast_prediction():
         }), 200
         
     except Exception as e:
-        print(f"[ML] Prediction error: {e}")
-        import traceback
-        traceback.print_exc()
+        log.exception("[ML] Prediction error: %s", e)
         return jsonify({
             'success': False,
             'error': f'Prediction failed: {str(e)}'
@@ -1911,7 +2168,7 @@ def check_alerts():
         }), 200
         
     except Exception as e:
-        print(f"[Alerts] Error checking alerts: {e}")
+        log.warning("[Alerts] Error checking alerts: %s", e)
         return jsonify({
             'success': False,
             'error': str(e),
@@ -1945,7 +2202,7 @@ def health_check():
     return jsonify({
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
-        'version': '1.0.0'
+        'version': API_VERSION
     }), 200
 
 
@@ -1954,12 +2211,19 @@ def health_check():
 # =========================
 
 if __name__ == '__main__':
-    print("=" * 50)
-    print("🎓 Smart Classroom Backend Server")
-    print("=" * 50)
-    print("Server running on: http://localhost:5000")
-    print("API endpoints available at: http://localhost:5000/api/")
-    print("=" * 50)
-    # Disable debug mode to prevent auto-reload conflicts with serial port
-    # Use 'use_reloader=False' to keep IoT connection stable
-    app.run(debug=False, use_reloader=False, host='0.0.0.0', port=5000)
+    log.info("=" * 50)
+    log.info("🎓 Smart Classroom Backend Server")
+    log.info("=" * 50)
+    log.info("Server running on: http://localhost:5000")
+    log.info("API endpoints available at: http://localhost:5000/api/")
+    log.info("=" * 50)
+    # Serve with waitress when available so the long-lived MJPEG stream does not
+    # starve the dashboard's polling endpoints; each request gets a worker thread
+    try:
+        from waitress import serve
+        log.info("Serving with waitress (16 threads)")
+        serve(app, host='0.0.0.0', port=5000, threads=16)
+    except ImportError:
+        # Disable debug mode to prevent auto-reload conflicts with serial port
+        # Use 'use_reloader=False' to keep IoT connection stable
+        app.run(debug=False, use_reloader=False, threaded=True, host='0.0.0.0', port=5000)
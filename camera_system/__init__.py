@@ -5,6 +5,7 @@ Provides camera detection and ML model integration for Smart Classroom
 
 from .camera_detector import CameraDetector, CameraStream, get_system_info
 from .emotion_detector import EmotionDetector
+from .emotion_worker import EmotionWorkerProcess
 from .yolo_face_detector import YOLOFaceDetector
 from .ml_models import (
     YOLODetector,
@@ -17,6 +18,7 @@ __all__ = [
     'CameraStream',
     'get_system_info',
     'EmotionDetector',
+    'EmotionWorkerProcess',
     'YOLOFaceDetector',
     'YOLODetector',
     'CNNClassifier',
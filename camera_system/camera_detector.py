@@ -5,9 +5,18 @@ Detects available cameras on the system and provides camera access
 
 import cv2
 import platform
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Optional
 
 
+# Camera name templates for DirectShow devices, keyed by (width, height)
+_DSHOW_RESOLUTION_NAMES = {
+    (1920, 1080): 'HD Camera {} (possibly DroidCam/Virtual)',
+    (1280, 720): 'HD Camera {} (possibly Software Camera)',
+    (640, 480): 'Camera {} (Standard/Virtual)',
+}
+
 class CameraDetector:
     """Detects and manages available cameras including software cameras like DroidCam"""
     
@@ -15,7 +24,7 @@ class CameraDetector:
         self.available_cameras = []
         self.max_cameras_to_check = 10  # Check up to 10 indices to find all cameras including virtual ones
         
-    def detect_cameras(self) -> List[Dict[str, any]]:
+    def detect_cameras(self, deep_probe: bool = False, exhaustive: bool = False) -> List[Dict[str, any]]:
         """
         Detect all available cameras on the system including:
         - Built-in webcams
@@ -23,6 +32,11 @@ class CameraDetector:
         - Software cameras (DroidCam, OBS Virtual Camera, etc.)
         - Network cameras
         
+        Args:
+            deep_probe: Decode a full frame from each camera instead of only grabbing one
+            exhaustive: Probe every index up to max_cameras_to_check instead of stopping
+                        after two consecutive missing indices
+        
         Returns:
             List of dictionaries containing camera information
         """
@@ -37,67 +51,106 @@ class CameraDetector:
         
         detected_indices = set()  # Track which camera indices we've already found
         
-        # Try each backend
+        # Camera indices are normally contiguous from 0, so unless an exhaustive scan
+        # is requested, indices are probed in waves of two and a backend is abandoned
+        # after two consecutive misses. Probes within a wave run in parallel since a
+        # failing VideoCapture open can block for hundreds of ms. Backends stay
+        # sequential so the same device is never opened by two backends at once.
+        wave_size = self.max_cameras_to_check if exhaustive else 2
+        
         for backend in backends:
-            # Scan camera indices
-            for index in range(self.max_cameras_to_check):
-                # Skip if we already detected this camera with another backend
-                if index in detected_indices:
-                    continue
+            found_by_earlier_backend = set(detected_indices)
+            consecutive_failures = 0
+            
+            with ThreadPoolExecutor(max_workers=wave_size) as executor:
+                for start in range(0, self.max_cameras_to_check, wave_size):
+                    wave = range(start, min(start + wave_size, self.max_cameras_to_check))
+                    to_probe = [i for i in wave if i not in found_by_earlier_backend]
+                    results = dict(zip(to_probe, executor.map(
+                        lambda i: self._probe_camera(i, backend, deep_probe), to_probe)))
                     
-                try:
-                    # Try to open camera
-                    cap = cv2.VideoCapture(index, backend)
-                    
-                    if cap.isOpened():
-                        # Try to read a frame to verify camera actually works
-                        ret, frame = cap.read()
+                    # Walk the wave in index order, matching the old serial scan
+                    for index in wave:
+                        if index in found_by_earlier_backend:
+                            consecutive_failures = 0
+                            continue
                         
-                        if ret and frame is not None:
-                            # Get camera properties
-                            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-                            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-                            fps = int(cap.get(cv2.CAP_PROP_FPS))
-                            backend_name = cap.getBackendName()
-                            
-                            # Detect camera type based on properties
-                            camera_type = self._detect_camera_type(index, width, height, backend_name)
-                            
-                            camera_info = {
-                                'id': index,
-                                'name': camera_type,
-                                'resolution': f'{width}x{height}',
-                                'fps': fps if fps > 0 else 30,
-                                'status': 'available',
-                                'width': width,
-                                'height': height,
-                                'backend': backend_name,
-                                'type': camera_type
-                            }
-                            
-                            self.available_cameras.append(camera_info)
-                            detected_indices.add(index)
-                            print(f"✓ Found camera {index}: {camera_type} ({width}x{height}) via {backend_name}")
+                        camera_info = results[index]
+                        if camera_info is None:
+                            consecutive_failures += 1
+                            continue
                         
-                        cap.release()
-                except Exception as e:
-                    # Silently continue on errors
-                    continue
+                        consecutive_failures = 0
+                        self.available_cameras.append(camera_info)
+                        detected_indices.add(index)
+                        print(f"✓ Found camera {index}: {camera_info['type']} "
+                              f"({camera_info['width']}x{camera_info['height']}) via {camera_info['backend']}")
+                    
+                    if not exhaustive and consecutive_failures >= 2:
+                        break
         
         return self.available_cameras
     
+    def _probe_camera(self, index: int, backend: int, deep_probe: bool = False) -> Optional[Dict[str, any]]:
+        """
+        Open one camera index with one backend and describe it if it delivers frames
+        
+        Args:
+            index: Camera index to open
+            backend: OpenCV capture backend (cv2.CAP_*)
+            deep_probe: Verify with a full read() (decode) instead of grab()
+        
+        Returns:
+            Camera info dictionary, or None if the camera is absent or not working
+        """
+        try:
+            # Try to open camera
+            cap = cv2.VideoCapture(index, backend)
+            try:
+                if not cap.isOpened():
+                    return None
+                
+                # Verify the camera actually delivers frames; grab() skips the decode
+                if deep_probe:
+                    ret, frame = cap.read()
+                    if not ret or frame is None:
+                        return None
+                elif not cap.grab():
+                    return None
+                
+                # Get camera properties
+                width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+                height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+                if width <= 0 or height <= 0:
+                    return None
+                fps = int(cap.get(cv2.CAP_PROP_FPS))
+                backend_name = cap.getBackendName()
+            finally:
+                cap.release()
+            
+            # Detect camera type based on properties
+            camera_type = self._detect_camera_type(index, width, height, backend_name)
+            
+            return {
+                'id': index,
+                'name': camera_type,
+                'resolution': f'{width}x{height}',
+                'fps': fps if fps > 0 else 30,
+                'status': 'available',
+                'width': width,
+                'height': height,
+                'backend': backend_name,
+                'type': camera_type
+            }
+        except Exception:
+            # Silently continue on errors
+            return None
+    
     def _detect_camera_type(self, index: int, width: int, height: int, backend: str) -> str:
         """Detect the type of camera based on properties"""
         # Common software camera resolutions and patterns
-        if 'dshow' in backend.lower():
-            if width == 1920 and height == 1080:
-                return f'HD Camera {index} (possibly DroidCam/Virtual)'
-            elif width == 1280 and height == 720:
-                return f'HD Camera {index} (possibly Software Camera)'
-            elif width == 640 and height == 480:
-                return f'Camera {index} (Standard/Virtual)'
-        
-        return f'Camera {index}'
+        template = _DSHOW_RESOLUTION_NAMES.get((width, height)) if 'dshow' in backend.lower() else None
+        return template.format(index) if template else f'Camera {index}'
     
     def get_camera_info(self, camera_id: int) -> Optional[Dict[str, any]]:
         """Get information about a specific camera"""
@@ -131,6 +184,7 @@ class CameraStream:
         self.camera_id = camera_id
         self.capture = None
         self.is_running = False
+        self._frame_local = threading.local()  # Per-reader frame buffer reused by read_frame
         
     def start(self) -> bool:
         """Start camera capture"""
@@ -159,10 +213,20 @@ class CameraStream:
                 self.capture = None
     
     def read_frame(self):
-        """Read a single frame from camera"""
+        """
+        Read a single frame from camera
+        
+        The frame is decoded into a buffer owned by the calling thread and reused on
+        its next call, so no new array is allocated per frame. Copy the frame if it
+        must outlive the next read_frame() on the same thread.
+        """
         if self.capture and self.is_running:
-            ret, frame = self.capture.read()
+            if not self.capture.grab():
+                return None
+            ret, frame = self.capture.retrieve(getattr(self._frame_local, 'buffer', None))
             if ret:
+                # retrieve() reallocates if the resolution changed; keep whatever it returned
+                self._frame_local.buffer = frame
                 return frame
         return None
     
@@ -177,7 +241,14 @@ class CameraStream:
             height = int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
             return (width, height)
         return (0, 0)
-    
+
+    @property
+    def fps(self) -> float:
+        """Get the frame rate reported by the capture device (0 if not open)"""
+        if self.capture:
+            return float(self.capture.get(cv2.CAP_PROP_FPS))
+        return 0.0
+
     def set_resolution(self, width: int, height: int):
         """Set camera resolution"""
         if self.capture:
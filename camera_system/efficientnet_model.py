@@ -6,12 +6,75 @@ Maps 7 raw emotions to 6 engagement states for classroom analysis
 
 import torch
 import torch.nn as nn
-from torchvision import models, transforms
-from PIL import Image
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+from torchvision import models
 import cv2
 import numpy as np
-from typing import Tuple, Dict
+from typing import Tuple, Dict, List, Optional
+import functools
 import os
+import threading
+
+NUM_EMOTIONS = 7
+INPUT_SIZE = (260, 260)  # EfficientNet-B2 input (from training code)
+IMAGENET_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+IMAGENET_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+
+def _build_model(weights_path: str, device: torch.device) -> nn.Module:
+    """Build EfficientNet-B2 with the 7-class head and load the trained weights (eval mode)"""
+    # Use EfficientNet-B2 (1408 features) instead of B0 (1280 features)
+    model = models.efficientnet_b2(weights=None)
+    num_features = model.classifier[1].in_features
+    model.classifier[1] = nn.Linear(num_features, NUM_EMOTIONS)
+    
+    state_dict = torch.load(weights_path, map_location=device)
+    if isinstance(state_dict, dict) and 'state_dict' in state_dict:
+        state_dict = state_dict['state_dict']
+    
+    model.load_state_dict(state_dict)
+    model.to(device)
+    model.eval()
+    model.requires_grad_(False)  # inference only; no parameter ever tracks gradients
+    return _fuse_conv_bn(model)
+
+
+def _fuse_conv_bn(model: nn.Module) -> nn.Module:
+    """
+    Fold every eval-mode BatchNorm2d into the Conv2d before it (in place)
+    
+    torchvision's Conv2dNormActivation blocks are Sequential(Conv2d, BatchNorm2d, act):
+    the conv absorbs BN's scale/shift (W' = W * gamma / sqrt(var + eps), b' = beta - mean * gamma / sqrt(var + eps))
+    and the BN slot becomes an Identity, so each block runs one conv kernel instead of conv + BN.
+    """
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        for i in range(len(module) - 1):
+            if isinstance(module[i], nn.Conv2d) and isinstance(module[i + 1], nn.BatchNorm2d):
+                module[i] = fuse_conv_bn_eval(module[i], module[i + 1])
+                module[i + 1] = nn.Identity()
+    return model
+
+
+def enable_cuda_autotuning():
+    """
+    Opt in to cuDNN autotuning and TF32 math for this process (call once at startup)
+    
+    Input is always 260x260, so cuDNN can autotune conv algorithms once per batch size,
+    and TF32 speeds up FP32 convolutions and matmuls on Ampere and newer GPUs. These are
+    process-wide torch settings that also apply to every other model in the process
+    (e.g. YOLO), so the detector never changes them itself.
+    """
+    torch.backends.cudnn.benchmark = True
+    torch.backends.cuda.matmul.allow_tf32 = True
+    torch.backends.cudnn.allow_tf32 = True
+
+
+def _top1(probs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-row argmax index and its probability for an (N, C) array"""
+    indices = probs.argmax(axis=1)
+    return indices, probs[np.arange(len(probs)), indices]
 
 
 class EfficientNetEmotionDetector:
@@ -35,6 +98,9 @@ class EfficientNetEmotionDetector:
         'Fear': 'Confused'
     }
     
+    # Engagement state per label index (aligned with EMOTION_LABELS) for the post-argmax lookup
+    IDX_TO_ENGAGEMENT = tuple(map(EMOTION_TO_ENGAGEMENT.get, EMOTION_LABELS))
+    
     def __init__(self, model_path='static/model/fer2013-bestmodel-new.pth'):
         """
         Initialize EfficientNet-B2 emotion detector
@@ -43,16 +109,26 @@ class EfficientNetEmotionDetector:
             model_path: Path to trained model weights (.pth file)
         """
         self.model_path = model_path
+        # One inference at a time per instance: the staging buffers below are shared by
+        # every thread using this (cached) detector
+        self._infer_lock = threading.Lock()
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         self.model = None
         self.emotion_labels = self.EMOTION_LABELS
+        self._pinned = None  # Reusable page-locked input slab (CUDA only), grown to the largest batch
+        self._stage_gpu = None  # Device-side twin of the pinned slab (the H2D copy target)
+        self._result_pinned = None  # Pinned D2H landing buffer for probabilities (CUDA only)
         
         # EfficientNet-B2 expects 260x260 input (from training code)
-        self.transform = transforms.Compose([
-            transforms.Resize((260, 260)),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-        ])
+        self.input_size = INPUT_SIZE
+        
+        # ToTensor (/255) + Normalize(mean, std) folded into one scale and offset per channel
+        self._norm_scale = 1.0 / (255.0 * IMAGENET_STD)
+        self._norm_offset = -IMAGENET_MEAN / IMAGENET_STD
+        if self.device.type == 'cuda':
+            # Same scale/offset as (1, 3, 1, 1) device tensors for on-GPU normalization
+            self._norm_scale_t = torch.from_numpy(self._norm_scale).view(1, 3, 1, 1).to(self.device)
+            self._norm_offset_t = torch.from_numpy(self._norm_offset).view(1, 3, 1, 1).to(self.device)
         
         self._load_model()
     def _load_model(self):
@@ -60,26 +136,14 @@ class EfficientNetEmotionDetector:
         try:
             print(f"[EfficientNet-B2] Loading model...")
             
-            model_path = 'static/model/fer2013-bestmodel-new.pth'
+            model_path = self.model_path
             
             if not os.path.exists(model_path):
                 raise FileNotFoundError(f"Model file not found: {model_path}")
             
             print(f"[EfficientNet-B2] Loading PyTorch model from: {model_path}")
             
-            # Use EfficientNet-B2 (1408 features) instead of B0 (1280 features)
-            self.model = models.efficientnet_b2(weights=None)
-            num_features = self.model.classifier[1].in_features
-            self.model.classifier[1] = nn.Linear(num_features, len(self.EMOTION_LABELS))
-            
-            state_dict = torch.load(model_path, map_location=self.device)
-            if isinstance(state_dict, dict) and 'state_dict' in state_dict:
-                state_dict = state_dict['state_dict']
-            
-            self.model.load_state_dict(state_dict)
-            self.model.to(self.device)
-            self.model.eval()
-            self.model_path = model_path
+            self.model = _build_model(model_path, self.device)
             
             print(f"✓ Successfully loaded EfficientNet-B2 model from: {model_path}")
             print(f"  Device: {self.device}")
@@ -93,50 +157,160 @@ class EfficientNetEmotionDetector:
             traceback.print_exc()
             self.model = None
     
-    def predict_emotion(self, face_image) -> Tuple[str, str, float, Dict[str, float]]:
+    def _resize_face(self, face_image, out: Optional[np.ndarray] = None, rgb: bool = True) -> np.ndarray:
+        """
+        Resize a BGR (or grayscale) face crop to a 260x260x3 uint8 array (written into out if given)
+        
+        Channels are RGB, or left in BGR order when rgb=False (the CUDA path swaps them on the GPU).
+        """
+        if len(face_image.shape) == 3:
+            # Resize first so the channel swap touches 260x260 pixels, not the full-resolution crop
+            if not rgb:
+                return cv2.resize(face_image, self.input_size, dst=out, interpolation=cv2.INTER_LINEAR)
+            code = cv2.COLOR_BGR2RGB
+        else:
+            code = cv2.COLOR_GRAY2RGB
+        
+        resized = cv2.resize(face_image, self.input_size, interpolation=cv2.INTER_LINEAR)
+        if out is None:
+            return cv2.cvtColor(resized, code)
+        cv2.cvtColor(resized, code, dst=out)
+        return out
+    
+    def _preprocess_face(self, face_image) -> np.ndarray:
+        """
+        Convert a BGR (or grayscale) face crop to a normalized 3x260x260 float32 array
+        
+        Replaces the PIL round-trip: one cv2.resize on the uint8 crop, then a single
+        fused scale + offset pass into float32.
+        """
+        resized = self._resize_face(face_image)
+        
+        normalized = np.multiply(resized, self._norm_scale, dtype=np.float32)
+        normalized += self._norm_offset
+        
+        # HWC -> CHW
+        return normalized.transpose(2, 0, 1)
+    
+    def _forward(self, face_images: List[np.ndarray],
+                 return_all_probs: bool = True) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """
+        Preprocess face crops and run the model on them as one batch
+        
+        On CUDA the crops are resized straight into a pinned uint8 BGR slab, uploaded
+        (4x fewer bytes than float32), then channel-swapped and normalized on the GPU;
+        on CPU they are normalized with NumPy.
+        
+        Args:
+            face_images: Face crops in BGR format
+            return_all_probs: Compute the full (N, 7) softmax; when False only the top-1
+                              confidence is derived from the logits
+        
+        Returns:
+            (predicted_indices, confidences, probabilities or None), copied to the host in one transfer
+        """
+        if self.device.type == 'cuda':
+            # Staging, forward and readback all reuse per-instance buffers
+            with self._infer_lock:
+                return self._forward_cuda(face_images, return_all_probs)
+        
+        batch = np.stack([self._preprocess_face(face_image) for face_image in face_images])
+        with self._infer_lock, torch.inference_mode():
+            outputs = self.model(torch.from_numpy(batch))
+        
+        return self._top1_from_logits(outputs, return_all_probs)
+    
+    def _forward_cuda(self, face_images: List[np.ndarray],
+                      return_all_probs: bool) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """CUDA half of _forward (caller holds _infer_lock)"""
+        n = len(face_images)
+        # Stage through pinned memory so the H2D copy is a true async DMA
+        if self._pinned is None or self._pinned.shape[0] < n:
+            self._pinned = torch.empty((n, *self.input_size[::-1], 3), dtype=torch.uint8, pin_memory=True)
+            self._stage_gpu = torch.empty_like(self._pinned, device=self.device)
+        host_np = self._pinned[:n].numpy()
+        for i, face_image in enumerate(face_images):
+            self._resize_face(face_image, out=host_np[i], rgb=False)
+        
+        with torch.inference_mode():
+            stage = self._stage_gpu[:n]
+            stage.copy_(self._pinned[:n], non_blocking=True)
+            
+            # BGR -> RGB on the small uint8 tensor, NHWC -> NCHW (a stride change), then
+            # float with scale + offset in place
+            tensor = stage.flip(3).permute(0, 3, 1, 2).float()
+            tensor.mul_(self._norm_scale_t).add_(self._norm_offset_t)
+            outputs = self.model(tensor)
+        
+        return self._top1_from_logits(outputs, return_all_probs)
+    
+    def _top1_from_logits(self, outputs: torch.Tensor,
+                          return_all_probs: bool) -> Tuple[np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        """Turn (N, 7) model logits into (predicted_indices, confidences, probabilities or None) on the host"""
+        with torch.inference_mode():
+            if not return_all_probs:
+                # argmax(softmax) == argmax(logits); top-1 probability is exp(top - logsumexp)
+                logits = outputs.float()
+                top_logit, top_idx = logits.max(dim=1)
+                top = torch.stack([top_idx.float(), (top_logit - logits.logsumexp(dim=1)).exp()], dim=1)
+                top = self._to_host(top)
+                return top[:, 0].astype(np.int64), top[:, 1], None
+            
+            probabilities = torch.softmax(outputs, dim=1, dtype=torch.float32)
+        
+        # Single device->host sync per batch; argmax etc. then run on the host copy
+        probs = self._to_host(probabilities)
+        return (*_top1(probs), probs)
+    
+    def _to_host(self, tensor: torch.Tensor) -> np.ndarray:
+        """
+        Copy a small float32 result tensor to the host with one synchronization
+        
+        On CUDA the copy lands in a reusable pinned buffer (a DMA without the pageable
+        bounce copy) and only the current stream is waited on, not the whole device.
+        """
+        if tensor.device.type != 'cuda':
+            return tensor.numpy()
+        
+        if self._result_pinned is None or self._result_pinned.numel() < tensor.numel():
+            self._result_pinned = torch.empty(tensor.numel(), dtype=torch.float32, pin_memory=True)
+        host = self._result_pinned[:tensor.numel()].view(tensor.shape)
+        host.copy_(tensor, non_blocking=True)
+        torch.cuda.current_stream().synchronize()
+        # Copy out: the pinned buffer is reused by the next batch
+        return host.numpy().copy()
+    
+    def predict_emotion(self, face_image,
+                        return_all_probs: bool = True) -> Tuple[str, str, float, Optional[Dict[str, float]]]:
         """
         Predict emotion from face image
         
         Args:
             face_image: Face image in BGR format (from OpenCV)
+            return_all_probs: Build all_predictions; pass False when only the top emotion is used
             
         Returns:
             Tuple of:
             - raw_emotion: Raw FER-2013 emotion label
             - engagement_state: Mapped engagement state
             - confidence: Prediction confidence (0-1)
-            - all_predictions: Dictionary of all emotion probabilities
+            - all_predictions: Dictionary of all emotion probabilities (None if not requested)
         """
         if self.model is None:
             print("[EfficientNet] WARNING: Model is None! Returning default Neutral.")
             return 'Neutral', 'Engaged', 0.0, {label: 0.0 for label in self.EMOTION_LABELS}
         
         try:
-            if len(face_image.shape) == 3:
-                face_rgb = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-            else:
-                face_rgb = face_image
-            
-            pil_image = Image.fromarray(face_rgb)
-            tensor = self.transform(pil_image)
-            tensor = tensor.unsqueeze(0).to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model(tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-                confidence, predicted_idx = torch.max(probabilities, dim=1)
-            
-            predicted_idx = predicted_idx.item()
-            confidence = confidence.item()
+            predicted_indices, confidences, probs = self._forward([face_image], return_all_probs)
+            
+            predicted_idx = int(predicted_indices[0])
+            confidence = float(confidences[0])
             raw_emotion = self.EMOTION_LABELS[predicted_idx]
             
-            all_probs = probabilities[0].cpu().numpy()
-            all_predictions = {
-                label: float(prob) 
-                for label, prob in zip(self.EMOTION_LABELS, all_probs)
-            }
+            # .tolist() converts all 7 probabilities in one C-level call
+            all_predictions = dict(zip(self.EMOTION_LABELS, probs[0].tolist())) if probs is not None else None
             
-            engagement_state = self.EMOTION_TO_ENGAGEMENT.get(raw_emotion, 'Engaged')
+            engagement_state = self.IDX_TO_ENGAGEMENT[predicted_idx]
             
             return raw_emotion, engagement_state, confidence, all_predictions
             
@@ -146,58 +320,44 @@ class EfficientNetEmotionDetector:
             traceback.print_exc()
             return 'Neutral', 'Engaged', 0.0, {label: 0.0 for label in self.EMOTION_LABELS}
     
-    def predict_batch(self, face_images):
+    def predict_batch(self, face_images, return_all_probs: bool = True):
         """
         Predict emotions for multiple faces at once (batch processing)
         
         Args:
             face_images: List of face images in BGR format
+            return_all_probs: Build all_predictions; pass False when only the top emotion is used
             
         Returns:
-            List of tuples (raw_emotion, engagement_state, confidence, all_predictions)
+            List of tuples (raw_emotion, engagement_state, confidence, all_predictions);
+            all_predictions is None when return_all_probs is False
         """
         if self.model is None or len(face_images) == 0:
             return []
         
         try:
-            tensors = []
-            for face_image in face_images:
-                if len(face_image.shape) == 3:
-                    face_rgb = cv2.cvtColor(face_image, cv2.COLOR_BGR2RGB)
-                else:
-                    face_rgb = face_image
-                pil_image = Image.fromarray(face_rgb)
-                tensor = self.transform(pil_image)
-                tensors.append(tensor)
-            
-            batch_tensor = torch.stack(tensors).to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model(batch_tensor)
-                probabilities = torch.softmax(outputs, dim=1)
-                confidences, predicted_indices = torch.max(probabilities, dim=1)
-            
-            results = []
-            for i in range(len(face_images)):
-                predicted_idx = predicted_indices[i].item()
-                confidence = confidences[i].item()
-                raw_emotion = self.EMOTION_LABELS[predicted_idx]
-                engagement_state = self.EMOTION_TO_ENGAGEMENT.get(raw_emotion, 'Engaged')
-                
-                all_probs = probabilities[i].cpu().numpy()
-                all_predictions = {
-                    label: float(prob) 
-                    for label, prob in zip(self.EMOTION_LABELS, all_probs)
-                }
-                
-                results.append((raw_emotion, engagement_state, confidence, all_predictions))
-            
-            return results
+            return self._build_results(*self._forward(face_images, return_all_probs))
             
         except Exception as e:
             print(f"Error during batch prediction: {e}")
             return []
     
+    def _build_results(self, predicted_indices: np.ndarray, confidences: np.ndarray,
+                       probs_np: Optional[np.ndarray]) -> List[Tuple]:
+        """Assemble per-face (raw_emotion, engagement_state, confidence, all_predictions) tuples"""
+        rows = probs_np.tolist() if probs_np is not None else [None] * len(predicted_indices)
+        
+        results = []
+        for predicted_idx, confidence, all_probs in zip(predicted_indices.tolist(), confidences.tolist(), rows):
+            raw_emotion = self.EMOTION_LABELS[predicted_idx]
+            engagement_state = self.IDX_TO_ENGAGEMENT[predicted_idx]
+            
+            all_predictions = dict(zip(self.EMOTION_LABELS, all_probs)) if all_probs is not None else None
+            
+            results.append((raw_emotion, engagement_state, confidence, all_predictions))
+        
+        return results
+    
     def get_model_info(self) -> Dict:
         """Get information about the loaded model"""
         return {
@@ -219,6 +379,22 @@ class EfficientNetEmotionDetector:
                 f"emotions={len(self.EMOTION_LABELS)})")
 
 
+@functools.lru_cache(maxsize=4)
+def get_efficientnet_detector(model_path: str = 'static/model/fer2013-bestmodel-new.pth') -> EfficientNetEmotionDetector:
+    """
+    Get a process-wide EfficientNet-B2 detector, loading the model on first use
+    
+    Args:
+        model_path: Path to trained model weights (.pth file)
+        
+    Returns:
+        Shared EfficientNetEmotionDetector (the same instance for repeated calls with the same
+        arguments, so camera threads share one device-resident model; inference calls are
+        serialized per instance by its _infer_lock)
+    """
+    return EfficientNetEmotionDetector(model_path=model_path)
+
+
 # Test function
 def test_detector():
     """Test the EfficientNet detector with a sample image"""
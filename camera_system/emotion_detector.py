@@ -4,25 +4,94 @@ Uses YOLO11 for face detection and Keras/TensorFlow CNN for emotion recognition
 """
 
 import cv2
+import functools
+import logging
+import threading
 import numpy as np
+from scipy.optimize import linear_sum_assignment
 from typing import Dict, List, Tuple
 import os
 
+logger = logging.getLogger(__name__)
+
 # FER-2013 emotion labels (7 classes from computer vision model)
 EMOTION_LABELS = ['Happy', 'Surprise', 'Neutral', 'Sad', 'Angry', 'Disgust', 'Fear']
 
+# Label -> index into EMOTION_LABELS (and the per-emotion arrays below)
+EMOTION_INDEX = {emotion: i for i, emotion in enumerate(EMOTION_LABELS)}
+
+# BGR annotation color per label id (EMOTION_LABELS order)
+EMOTION_COLORS = (
+    (0, 255, 0),        # Happy: green
+    (238, 211, 34),     # Surprise: cyan
+    (246, 92, 139),     # Neutral: purple
+    (128, 128, 128),    # Sad: gray
+    (0, 0, 255),        # Angry: red
+    (22, 115, 249),     # Disgust: orange
+    (11, 158, 245),     # Fear: amber
+)
+
+
+# "<emotion> (" label prefix per label id (EMOTION_LABELS order); only the confidence is formatted per face
+LABEL_PREFIXES = tuple(f"{emotion} (" for emotion in EMOTION_LABELS)
+
+# Annotation label font (cv2.putText / cv2.getTextSize)
+LABEL_FONT = cv2.FONT_HERSHEY_SIMPLEX
+LABEL_FONT_SCALE = 0.6
+LABEL_THICKNESS = 2
+
+
+@functools.lru_cache(maxsize=8192)
+def _label_text_size(label: str) -> Tuple[int, int]:
+    """
+    (width, height) of an annotation label, memoized
+    
+    Labels are "<emotion> (<confidence>%)" with one decimal, so there are only ~7000 distinct
+    strings; after warm-up every face is a dict hit instead of a cv2.getTextSize call.
+    """
+    return cv2.getTextSize(label, LABEL_FONT, LABEL_FONT_SCALE, LABEL_THICKNESS)[0]
+
+
+def _box_iou(boxes_a: np.ndarray, boxes_b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU of (N, 4) and (M, 4) arrays of (x, y, w, h) boxes -> (N, M)"""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    inter_w = np.clip(np.minimum(a[..., 0] + a[..., 2], b[..., 0] + b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 1] + a[..., 3], b[..., 1] + b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    union = a[..., 2] * a[..., 3] + b[..., 2] * b[..., 3] - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def _format_predictions(raw_emotion: str, confidence: float, all_predictions: Dict[str, float]) -> str:
+    """Render one prediction for debug logging (only called when DEBUG is enabled)"""
+    lines = [f"[Keras Emotion Detection] Emotion: {raw_emotion} ({confidence*100:.1f}%)"]
+    lines.extend(f"    {emotion:10s}: {prob*100:5.1f}%" for emotion, prob in all_predictions.items())
+    return "\n".join(lines)
+
+
 class EmotionDetector:
     """Detects student emotions using YOLO11 face detection + Keras/TensorFlow CNN emotion recognition"""
     
+    # Longest side (px) frames are downscaled to before face detection (YOLO's native input size)
+    DETECT_SIZE = 640
+    
+    # Minimum IoU for a face box to inherit the emotion of a box from the previous frame
+    CARRY_IOU_THRESHOLD = 0.5
+    
     def __init__(self, 
                  emotion_model_path='static/model/emotion_model_combined.h5',
-                 yolo_model_path='static/model/best_yolo11_face.pt'):
+                 yolo_model_path='static/model/best_yolo11_face.pt',
+                 emotion_stride: int = 3):
         """
         Initialize emotion detector with YOLO face detection + Keras CNN emotion recognition
         
         Args:
             emotion_model_path: Path to the trained Keras/TensorFlow emotion model (.h5)
             yolo_model_path: Path to the trained YOLO11 face detection model (.pt)
+            emotion_stride: Classify every face only on every Nth frame; in between, faces
+                            overlapping a previous box keep its emotion and only new faces
+                            are classified (1 = classify every frame)
         """
         self.keras_detector = None
         self.yolo_detector = None
@@ -30,8 +99,34 @@ class EmotionDetector:
         self.yolo_model_path = yolo_model_path
         self.face_cascade = None  # Kept for backward compatibility
         self.emotion_counts = {emotion: 0 for emotion in EMOTION_LABELS}
+        self._counts_array = np.zeros(len(EMOTION_LABELS), dtype=np.int64)  # Same counts, EMOTION_LABELS order
         self.input_shape = (48, 48)  # Keras CNN input size (grayscale)
         
+        # Temporal subsampling of emotion inference (emotions change over seconds, not frames)
+        self.emotion_stride = max(1, int(emotion_stride))
+        
+        # Per-stream state (annotation buffer, stride position, carried boxes and labels),
+        # kept per calling thread: each thread running process_frame is its own video stream
+        self._stream_local = threading.local()
+        
+        # Stats for a frame without faces, built once (process_frame returns a shallow copy)
+        self._empty_stats = {
+            'total_faces': 0,
+            'emotions': {emotion: 0 for emotion in EMOTION_LABELS},
+            'emotion_percentages': {emotion: 0.0 for emotion in EMOTION_LABELS}
+        }
+        
+        # Engagement weight per FER-2013 emotion, in EMOTION_LABELS order
+        self._engagement_weights = np.array([
+            1.0,   # Happy: highly engaged
+            0.8,   # Surprise: engaged, attentive
+            0.6,   # Neutral: moderate engagement
+            0.3,   # Sad: low engagement
+            0.2,   # Angry: frustrated/disengaged
+            0.2,   # Disgust: disengaged
+            0.4,   # Fear: confused/uncertain
+        ], dtype=np.float64)
+        
         # Load both models
         self._load_keras_model()
         self._load_yolo_detector()
@@ -40,10 +135,10 @@ class EmotionDetector:
         """Load the trained Keras/TensorFlow emotion model"""
         try:
             # Import Keras detector
-            from camera_system.keras_emotion_model import KerasEmotionDetector
+            from camera_system.keras_emotion_model import get_keras_detector
             
-            # Initialize Keras model
-            self.keras_detector = KerasEmotionDetector(model_path=self.emotion_model_path)
+            # Shared Keras model (loaded once per process, reused by every EmotionDetector)
+            self.keras_detector = get_keras_detector(self.emotion_model_path)
             print(f"✓ Keras Emotion Model loaded: {self.emotion_model_path}")
                 
         except Exception as e:
@@ -92,19 +187,30 @@ class EmotionDetector:
             frame: Input image frame (BGR format)
             
         Returns:
-            List of face rectangles (x, y, w, h)
+            List of face rectangles (x, y, w, h) in full-frame coordinates
         """
+        # Downscale once to the detector input size; both detectors run on the small frame
+        frame_h, frame_w = frame.shape[:2]
+        scale = self.DETECT_SIZE / max(frame_h, frame_w)
+        if scale < 1.0:
+            small = cv2.resize(frame, (round(frame_w * scale), round(frame_h * scale)),
+                               interpolation=cv2.INTER_LINEAR)
+        else:
+            small, scale = frame, 1.0
+        inv_scale = 1.0 / scale
+        
         # Try YOLO first
         if self.yolo_detector and self.yolo_detector.is_loaded:
             try:
-                yolo_faces, count = self.yolo_detector.detect_faces(frame, conf_threshold=0.5)
-                # Convert YOLO format (x1, y1, x2, y2) to Haar format (x, y, w, h)
+                yolo_faces, count = self.yolo_detector.detect_faces(small, conf_threshold=0.5)
+                # Convert YOLO format (x1, y1, x2, y2) to Haar format (x, y, w, h), back in frame pixels
                 faces = []
                 for face in yolo_faces:
                     x1, y1, x2, y2 = face['bbox']
-                    w = x2 - x1
-                    h = y2 - y1
-                    faces.append((x1, y1, w, h))
+                    x, y = round(x1 * inv_scale), round(y1 * inv_scale)
+                    w = round(x2 * inv_scale) - x
+                    h = round(y2 * inv_scale) - y
+                    faces.append((x, y, w, h))
                 return faces
             except Exception as e:
                 print(f"[YOLO] Error during detection, falling back to Haar Cascade: {e}")
@@ -113,22 +219,25 @@ class EmotionDetector:
         if self.face_cascade is None:
             return []
         
-        # Convert to grayscale
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Convert to grayscale (UMat: runs on OpenCL when available, else the vectorized CPU path)
+        gray = cv2.cvtColor(cv2.UMat(small), cv2.COLOR_BGR2GRAY)
         
         # Apply histogram equalization to improve detection in varying lighting
         gray = cv2.equalizeHist(gray)
         
         # Detect faces with optimized parameters
+        min_face = max(24, round(48 * scale))  # 48px in the full frame; 24px is the cascade window
         faces = self.face_cascade.detectMultiScale(
             gray,
             scaleFactor=1.1,      # How much image size is reduced at each scale
             minNeighbors=5,       # How many neighbors each candidate rectangle should have
-            minSize=(48, 48),     # Minimum face size (matches model input)
+            minSize=(min_face, min_face),  # Minimum face size (matches model input)
             flags=cv2.CASCADE_SCALE_IMAGE
         )
         
-        return faces
+        if scale == 1.0 or len(faces) == 0:
+            return faces
+        return [tuple(box) for box in np.round(np.asarray(faces) * inv_scale).astype(int).tolist()]
     
     def predict_emotion(self, face_image) -> Tuple[str, float]:
         """
@@ -147,13 +256,9 @@ class EmotionDetector:
             # Use Keras CNN detector to predict emotion
             raw_emotion, engagement_state, confidence, all_predictions = self.keras_detector.predict_emotion(face_image)
             
-            # Debug: Print predictions if confident
-            if confidence > 0.3:
-                print(f"\n[Keras Emotion Detection]")
-                print(f"  Emotion: {raw_emotion} ({confidence*100:.1f}%)")
-                print(f"  All Predictions:")
-                for emotion, prob in all_predictions.items():
-                    print(f"    {emotion:10s}: {prob*100:5.1f}%")
+            # Debug: log predictions if confident (formatting skipped unless DEBUG is on)
+            if confidence > 0.3 and logger.isEnabledFor(logging.DEBUG):
+                logger.debug(_format_predictions(raw_emotion, confidence, all_predictions))
             
             return raw_emotion, confidence
             
@@ -163,6 +268,92 @@ class EmotionDetector:
             traceback.print_exc()
             return 'Neutral', 0.0
     
+    def predict_emotions(self, face_images: List[np.ndarray]) -> List[Tuple[str, float]]:
+        """
+        Predict emotions for all faces of a frame with a single batched model call
+        
+        Args:
+            face_images: Cropped face images (BGR format from OpenCV)
+            
+        Returns:
+            List of (emotion_label, confidence), one per face
+        """
+        results = [('Neutral', 0.0)] * len(face_images)
+        if self.keras_detector is None:
+            return results
+        
+        # Empty crops (boxes clipped at the frame edge) can't be resized; leave them Neutral
+        valid = [i for i, face in enumerate(face_images) if face.size > 0]
+        if not valid:
+            return results
+        
+        if len(valid) == 1:
+            # Single face (common in small rooms): skip the batch buffer and pipeline setup
+            raw_emotion, _, confidence, _ = self.keras_detector.predict_emotion(
+                face_images[valid[0]], return_all_probs=False)
+            results[valid[0]] = (raw_emotion, confidence)
+            return results
+        
+        # Only the top emotion is used here, so skip building the per-face probability dicts
+        predictions = self.keras_detector.predict_batch([face_images[i] for i in valid], return_all_probs=False)
+        if len(predictions) != len(valid):
+            # Batch failed; fall back to one face at a time
+            predictions = [(emotion, None, confidence, None)
+                           for emotion, confidence in (self.predict_emotion(face_images[i]) for i in valid)]
+        
+        for i, (raw_emotion, _, confidence, _) in zip(valid, predictions):
+            results[i] = (raw_emotion, confidence)
+        return results
+    
+    def _stream_state(self) -> threading.local:
+        """This thread's stream state, created on its first process_frame call"""
+        state = self._stream_local
+        if not hasattr(state, 'frame_idx'):
+            state.anno_buf = None  # Reusable annotated-frame buffer, reallocated only when the frame shape changes
+            state.frame_idx = 0
+            state.last_boxes = np.empty((0, 4), dtype=np.float32)
+            state.last_predictions = []
+        return state
+    
+    def _predict_or_carry(self, frame, faces, state) -> List[Tuple[str, float]]:
+        """
+        Emotions for this frame's faces, classifying only on every emotion_stride-th frame
+        
+        On the frames in between, faces are matched one-to-one to the previous frame's boxes
+        by IoU (Hungarian assignment) and keep that box's emotion when IoU >=
+        CARRY_IOU_THRESHOLD; only unmatched (new) faces are classified.
+        
+        Args:
+            frame: Input video frame
+            faces: Face boxes (x, y, w, h) detected in frame
+            state: The calling thread's stream state (see _stream_state)
+        """
+        boxes = np.asarray(faces, dtype=np.float32).reshape(-1, 4)
+        full_pass = state.frame_idx % self.emotion_stride == 0
+        state.frame_idx += 1
+        
+        if full_pass or len(state.last_boxes) == 0 or len(boxes) == 0:
+            predictions = self.predict_emotions([frame[y:y+h, x:x+w] for (x, y, w, h) in faces])
+        else:
+            iou = _box_iou(boxes, state.last_boxes)
+            rows, cols = linear_sum_assignment(iou, maximize=True)
+            matched = iou[rows, cols] >= self.CARRY_IOU_THRESHOLD
+            
+            # Previous-box index per current face, -1 when unmatched
+            prev_idx = np.full(len(boxes), -1, dtype=np.intp)
+            prev_idx[rows[matched]] = cols[matched]
+            
+            predictions = [state.last_predictions[j] if j >= 0 else None for j in prev_idx.tolist()]
+            new_faces = [i for i, j in enumerate(prev_idx.tolist()) if j < 0]
+            if new_faces:
+                new_predictions = self.predict_emotions(
+                    [frame[y:y+h, x:x+w] for (x, y, w, h) in (faces[i] for i in new_faces)])
+                for i, prediction in zip(new_faces, new_predictions):
+                    predictions[i] = prediction
+        
+        state.last_boxes, state.last_predictions = boxes, predictions
+        return predictions
+    
     def process_frame(self, frame) -> Tuple[np.ndarray, Dict]:
         """
         Process frame to detect faces and emotions
@@ -171,38 +362,50 @@ class EmotionDetector:
             frame: Input video frame
             
         Returns:
-            Tuple of (annotated_frame, emotion_stats)
+            Tuple of (annotated_frame, emotion_stats); annotated_frame is the input frame
+            itself (not a copy) when no faces were found. Otherwise it is a buffer owned by
+            the calling thread and reused by its next call; copy it to keep it.
         """
-        annotated_frame = frame.copy()
-        
-        # Reset emotion counts
-        self.emotion_counts = {emotion: 0 for emotion in EMOTION_LABELS}
+        state = self._stream_state()
         
         # Detect faces
         faces = self.detect_faces(frame)
         num_faces = len(faces)
         
+        if num_faces == 0:
+            # Nothing to classify or draw; carry no labels into the next frame
+            state.frame_idx += 1
+            state.last_boxes, state.last_predictions = state.last_boxes[:0], []
+            self._counts_array[:] = 0
+            self.emotion_counts = self._empty_stats['emotions']
+            # Shallow copy: callers add keys (e.g. 'engagement') to the returned dict
+            return frame, dict(self._empty_stats)
+        
+        if state.anno_buf is None or state.anno_buf.shape != frame.shape or state.anno_buf.dtype != frame.dtype:
+            state.anno_buf = np.empty_like(frame)
+        annotated_frame = state.anno_buf
+        np.copyto(annotated_frame, frame)
+        
+        # Predict emotions for all face regions in one batch (or reuse last frame's, see emotion_stride)
+        predictions = self._predict_or_carry(frame, faces, state)
+        
+        # Count emotions from integer label ids in one pass
+        label_ids = np.fromiter((EMOTION_INDEX[emotion] for emotion, _ in predictions),
+                                dtype=np.intp, count=len(predictions))
+        self._counts_array = np.bincount(label_ids, minlength=len(EMOTION_LABELS))
+        
         # Process each face
-        for (x, y, w, h) in faces:
-            # Extract face region
-            face_roi = frame[y:y+h, x:x+w]
-            
-            # Predict emotion
-            emotion, confidence = self.predict_emotion(face_roi)
-            
-            # Update emotion count
-            self.emotion_counts[emotion] += 1
-            
+        for (x, y, w, h), (emotion, confidence), label_id in zip(faces, predictions, label_ids.tolist()):
             # Draw rectangle around face
-            color = self._get_emotion_color(emotion)
+            color = EMOTION_COLORS[label_id]
             cv2.rectangle(annotated_frame, (x, y), (x+w, y+h), color, 2)
             
             # Draw emotion label
-            label = f"{emotion} ({confidence*100:.1f}%)"
+            label = LABEL_PREFIXES[label_id] + f"{confidence*100:.1f}%)"
             label_y = y - 10 if y - 10 > 10 else y + h + 20
             
             # Draw background for text
-            (text_width, text_height), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.6, 2)
+            text_width, text_height = _label_text_size(label)
             cv2.rectangle(annotated_frame, 
                          (x, label_y - text_height - 5), 
                          (x + text_width, label_y + 5), 
@@ -210,9 +413,10 @@ class EmotionDetector:
             
             # Draw text
             cv2.putText(annotated_frame, label, (x, label_y), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+                       LABEL_FONT, LABEL_FONT_SCALE, (255, 255, 255), LABEL_THICKNESS)
         
         # Calculate emotion statistics
+        self.emotion_counts = dict(zip(EMOTION_LABELS, self._counts_array.tolist()))
         emotion_stats = {
             'total_faces': num_faces,
             'emotions': self.emotion_counts,
@@ -223,51 +427,28 @@ class EmotionDetector:
     
     def _get_emotion_color(self, emotion: str) -> Tuple[int, int, int]:
         """Get BGR color for FER-2013 emotion"""
-        emotion_colors = {
-            'Happy': (0, 255, 0),          # Green
-            'Surprise': (238, 211, 34),    # Cyan
-            'Neutral': (246, 92, 139),     # Purple
-            'Sad': (128, 128, 128),        # Gray
-            'Angry': (0, 0, 255),          # Red
-            'Disgust': (22, 115, 249),     # Orange
-            'Fear': (11, 158, 245)         # Amber
-        }
-        return emotion_colors.get(emotion, (255, 255, 255))
+        label_id = EMOTION_INDEX.get(emotion)
+        return EMOTION_COLORS[label_id] if label_id is not None else (255, 255, 255)
     
     def _calculate_percentages(self, total_faces: int) -> Dict[str, float]:
         """Calculate percentage for each emotion"""
         if total_faces == 0:
             return {emotion: 0.0 for emotion in EMOTION_LABELS}
         
-        return {
-            emotion: (count / total_faces) * 100 
-            for emotion, count in self.emotion_counts.items()
-        }
+        # One vectorized scale of the count array instead of seven Python divides
+        return dict(zip(EMOTION_LABELS, (self._counts_array * (100.0 / total_faces)).tolist()))
     
     def get_engagement_from_emotions(self) -> float:
         """
         Calculate engagement score based on FER-2013 emotions
         Positive emotions = higher engagement, negative = lower
         """
-        if sum(self.emotion_counts.values()) == 0:
+        total_faces = int(self._counts_array.sum())
+        if total_faces == 0:
             return 0.0
         
-        # Weight FER-2013 emotions for engagement score
-        engagement_weights = {
-            'Happy': 1.0,      # Highly engaged
-            'Surprise': 0.8,   # Engaged, attentive
-            'Neutral': 0.6,    # Moderate engagement
-            'Sad': 0.3,        # Low engagement
-            'Angry': 0.2,      # Frustrated/disengaged
-            'Disgust': 0.2,    # Disengaged
-            'Fear': 0.4        # Confused/uncertain
-        }
-        
-        total_faces = sum(self.emotion_counts.values())
-        weighted_sum = sum(
-            self.emotion_counts[emotion] * weight 
-            for emotion, weight in engagement_weights.items()
-        )
+        # Weighted FER-2013 emotion counts (weights in __init__), one dot product
+        weighted_sum = float(self._counts_array @ self._engagement_weights)
         
         engagement = (weighted_sum / total_faces) * 100
         return round(engagement, 2)
@@ -297,6 +478,7 @@ class EmotionDetector:
         """Cleanup resources"""
         # Reset emotion counts
         self.emotion_counts = {emotion: 0 for emotion in EMOTION_LABELS}
+        self._counts_array[:] = 0
         # Clear any cached data
         if hasattr(self, 'model') and self.model is not None:
             # Model cleanup if needed
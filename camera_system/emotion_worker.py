@@ -0,0 +1,210 @@
+"""
+Emotion Worker Process
+Runs face detection + emotion recognition in a separate process so CNN inference
+executes in parallel with camera capture and JPEG encoding in the Flask process.
+Frames are exchanged through shared memory (one memcpy each way, no pickling).
+"""
+
+import multiprocessing as mp
+import queue
+import threading
+import time
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+
+def _emotion_worker_main(in_name: str, out_name: str, frame_shape: Tuple[int, ...],
+                         frame_ready, stop_event, result_queue, detector_kwargs: Dict):
+    """
+    Worker process entry point: load the detector once, then process frames on demand
+
+    The parent writes a frame into the input buffer and signals frame_ready (the read end
+    of a pipe); the worker
+    writes the annotated frame into the output buffer and reports stats on result_queue.
+    """
+    from camera_system.emotion_detector import EmotionDetector
+
+    in_shm = shared_memory.SharedMemory(name=in_name)
+    out_shm = shared_memory.SharedMemory(name=out_name)
+    frame_in = np.ndarray(frame_shape, dtype=np.uint8, buffer=in_shm.buf)
+    frame_out = np.ndarray(frame_shape, dtype=np.uint8, buffer=out_shm.buf)
+
+    try:
+        detector = EmotionDetector(**detector_kwargs)
+
+        while not stop_event.is_set():
+            if not frame_ready.poll(0.5):
+                continue
+            frame_ready.recv_bytes()
+
+            try:
+                annotated_frame, emotion_stats = detector.process_frame(frame_in)
+                emotion_stats['engagement'] = detector.get_engagement_from_emotions()
+                np.copyto(frame_out, annotated_frame)
+                result_queue.put(('ok', emotion_stats))
+            except Exception as e:
+                result_queue.put(('error', str(e)))
+    finally:
+        del frame_in, frame_out
+        in_shm.close()
+        out_shm.close()
+
+
+class EmotionWorkerProcess:
+    """
+    Owns a worker process running EmotionDetector.process_frame on shared-memory frames
+
+    Usage (one frame in flight at a time):
+        worker.submit(frame)          # copy frame into shared memory, wake the worker
+        result = worker.poll(1.0)     # (annotated_frame, emotion_stats) or None on timeout
+    
+    submit()/poll() assume a single caller; concurrent stream consumers use exchange(),
+    which serializes them and shares the latest result through last_annotated.
+    """
+
+    def __init__(self, frame_shape: Tuple[int, ...],
+                 emotion_model_path: str = 'static/model/emotion_model_combined.h5',
+                 yolo_model_path: str = 'static/model/best_yolo11_face.pt'):
+        """
+        Allocate shared frame buffers and start the worker process
+
+        Args:
+            frame_shape: Shape of the BGR frames that will be submitted (H, W, 3)
+            emotion_model_path: Path to the Keras emotion model used by the worker
+            yolo_model_path: Path to the YOLO11 face model used by the worker
+        """
+        self.frame_shape = tuple(frame_shape)
+        nbytes = int(np.prod(self.frame_shape))
+
+        # Spawn (not fork) so the child never inherits TF/OpenCV thread state
+        ctx = mp.get_context('spawn')
+
+        self._in_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._out_shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        self._frame_in = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._in_shm.buf)
+        self._frame_out = np.ndarray(self.frame_shape, dtype=np.uint8, buffer=self._out_shm.buf)
+        self._annotated = np.empty(self.frame_shape, dtype=np.uint8)
+
+        # A pipe rather than an Event: Event.set() waits for every sleeper to acknowledge,
+        # so a worker killed inside wait() would hang the parent's next submit()
+        frame_ready, self._frame_ready = ctx.Pipe(duplex=False)
+        self._stop_event = ctx.Event()
+        self._results = ctx.Queue()
+
+        self.process = ctx.Process(
+            target=_emotion_worker_main,
+            args=(self._in_shm.name, self._out_shm.name, self.frame_shape,
+                  frame_ready, self._stop_event, self._results,
+                  {'emotion_model_path': emotion_model_path, 'yolo_model_path': yolo_model_path}),
+            daemon=True
+        )
+        self.process.start()
+        frame_ready.close()  # The worker owns the read end; writes fail once it has exited
+        self._stopped = False
+        
+        # Shared by every stream consumer (guarded by _lock)
+        self._lock = threading.Lock()
+        self._in_flight = False
+        self.last_annotated = None
+        self.last_result_time = 0.0
+    
+    def is_alive(self) -> bool:
+        """True while the worker process is running and has not been stopped"""
+        return not self._stopped and self.process.is_alive()
+
+    def submit(self, frame: np.ndarray):
+        """Copy a frame into shared memory and wake the worker (caller must wait for poll() first)"""
+        np.copyto(self._frame_in, frame)
+        try:
+            self._frame_ready.send_bytes(b'\x01')
+        except OSError:
+            raise RuntimeError('Emotion worker process exited')
+
+    def poll(self, timeout: float = 1.0) -> Optional[Tuple[np.ndarray, Dict]]:
+        """
+        Wait for the result of the last submitted frame
+
+        Returns:
+            (annotated_frame, emotion_stats) or None if the worker did not answer in time.
+            The returned frame is reused by the next poll(); copy it to keep it.
+
+        Raises:
+            RuntimeError: if the worker reported an error or has exited
+        """
+        try:
+            status, payload = self._results.get(timeout=timeout)
+        except queue.Empty:
+            if not self.process.is_alive():
+                raise RuntimeError('Emotion worker process exited')
+            return None
+
+        if status != 'ok':
+            raise RuntimeError(payload)
+
+        # Copy out before the next submit() lets the worker overwrite the output buffer
+        np.copyto(self._annotated, self._frame_out)
+        return self._annotated, payload
+
+    def exchange(self, frame: np.ndarray) -> Optional[Tuple[np.ndarray, Dict]]:
+        """
+        Collect a finished result without waiting, then hand `frame` to the worker if it is idle
+        
+        Safe to call from several stream threads at once: only one frame is ever in flight,
+        and each result is returned to exactly one caller (the others see it through
+        last_annotated / last_result_time).
+        
+        Returns:
+            (annotated_frame, emotion_stats) to the caller that collected a new result, else None.
+            The frame is a fresh copy and is never overwritten.
+        
+        Raises:
+            RuntimeError: if the worker reported an error, has exited or was stopped
+        """
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError('Emotion worker process stopped')
+            if not self.process.is_alive():
+                self._in_flight = False
+                raise RuntimeError('Emotion worker process exited')
+            
+            result = None
+            if self._in_flight:
+                try:
+                    result = self.poll(timeout=0)
+                except RuntimeError:
+                    self._in_flight = False
+                    raise
+                if result is not None:
+                    self._in_flight = False
+                    annotated_frame, emotion_stats = result
+                    self.last_annotated = annotated_frame.copy()
+                    self.last_result_time = time.time()
+                    result = (self.last_annotated, emotion_stats)
+            
+            if not self._in_flight:
+                self.submit(frame)
+                self._in_flight = True
+            return result
+    
+    def stop(self):
+        """Stop the worker process and release shared memory"""
+        with self._lock:
+            if self._stopped:
+                return
+            self._stopped = True
+
+            self._stop_event.set()
+            self.process.join(timeout=2)
+            if self.process.is_alive():
+                self.process.terminate()
+
+            self._frame_ready.close()
+            del self._frame_in, self._frame_out
+            for shm in (self._in_shm, self._out_shm):
+                try:
+                    shm.close()
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
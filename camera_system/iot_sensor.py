@@ -14,6 +14,7 @@ import serial.tools.list_ports
 import threading
 import time
 import re
+from collections import deque
 from typing import Dict, Optional, List
 from datetime import datetime
 import queue
@@ -22,6 +23,85 @@ import os
 import numpy as np
 
 
+# =========================
+# Logging Database Settings
+# =========================
+
+# Memory-mapped I/O window for the logging DB (bytes, 0 disables); lets the forecast
+# and export reads page straight out of the OS cache instead of copying into SQLite's heap
+IOT_DB_MMAP_SIZE = int(os.environ.get('IOT_DB_MMAP_SIZE', 256 * 1024 * 1024))
+
+# Raw readings that must all be present before a reading is buffered/logged
+REQUIRED_SENSOR_KEYS = ('raw_temperature', 'raw_humidity', 'raw_light', 'raw_sound', 'raw_gas')
+
+# Prepared statements kept per logging connection
+IOT_DB_CACHED_STATEMENTS = 256
+
+# WAL pages before SQLite checkpoints on its own, and how often (seconds) the writer
+# thread checkpoints explicitly so the cost lands between batches, not inside one
+IOT_DB_WAL_AUTOCHECKPOINT = 10000
+IOT_DB_CHECKPOINT_INTERVAL = 60
+
+# Statements are module constants so every call passes the same SQL text and hits
+# sqlite3's per-connection prepared statement cache instead of re-parsing
+_INSERT_SENSOR_DATA_SQL = '''
+    INSERT INTO sensor_data 
+    (timestamp, session_id, temperature, humidity, light, sound, gas, 
+     environmental_score, temperature_norm, humidity_norm, light_norm, 
+     sound_norm, gas_norm, occupancy, happy, surprise, neutral, sad, angry, disgust, fear)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+_SELECT_RECENT_DATA_SQL = '''
+    SELECT * FROM (
+        SELECT timestamp, temperature, humidity, light, sound, gas,
+               occupancy, happy, surprise, neutral, sad, angry, disgust, fear,
+               COALESCE(CAST(strftime('%H', timestamp) AS INTEGER), 0) AS hour,
+               COALESCE(CAST(strftime('%M', timestamp) AS INTEGER), 0) AS minute,
+               COALESCE(happy, 0) + COALESCE(surprise, 0) + COALESCE(neutral, 0) AS high_engagement,
+               COALESCE(sad, 0) + COALESCE(angry, 0) + COALESCE(disgust, 0) + COALESCE(fear, 0) AS low_engagement
+        FROM sensor_data
+        WHERE session_id = ?
+        ORDER BY timestamp DESC
+        LIMIT ?
+    ) ORDER BY timestamp
+'''
+
+_SELECT_EXPORT_DATA_SQL = '''
+    SELECT timestamp, temperature, humidity, light, sound, gas, 
+           environmental_score, occupancy, happy, surprise, neutral, 
+           sad, angry, disgust, fear
+    FROM sensor_data
+    WHERE session_id = ?
+    ORDER BY timestamp
+'''
+
+_SELECT_SESSION_COUNT_SQL = 'SELECT record_count FROM session_summary WHERE session_id = ?'
+_SELECT_TOTAL_COUNT_SQL = 'SELECT SUM(record_count) FROM session_summary'
+
+
+# =========================
+# Serial Line Parsing
+# =========================
+
+# Seconds a blocking serial read waits for a line; bounds how long stop_reading() waits
+SERIAL_READ_TIMEOUT = 0.5
+
+# Longest partial line kept between reads (guards against a stream with no newlines)
+SERIAL_MAX_LINE_BYTES = 4096
+
+# One compiled alternation for every Arduino output line format (e.g. "Humidity: 65.4 %"):
+# a single scan per line, and the value's group name (match.lastgroup) is the sensor
+_SENSOR_LINE_PATTERN = re.compile(
+    r'Humidity:\s*(?P<humidity>[\d.]+)'
+    r'|Temperature:\s*(?P<temperature>[\d.]+)'
+    r'|Light:\s*(?P<light>[\d.]+)'
+    r'|Sound:\s*(?P<sound>\d+)'
+    r'|Gas.*:\s*(?P<gas>\d+)',
+    re.IGNORECASE
+)
+
+
 # =========================
 # Sensor Conversion Constants (from conversion.py)
 # =========================
@@ -77,6 +157,30 @@ def getDBA(soundRaw: float) -> float:
     return round(dBA, 1)
 
 
+def get_session_record_count(conn: sqlite3.Connection, session_id: str = None) -> int:
+    """
+    Read the number of logged readings from the session_summary rollup
+    
+    Args:
+        conn: Connection to an IoT logging database
+        session_id: Session to count, or None for all sessions in the file
+    
+    Returns:
+        Record count (falls back to COUNT(*) for databases created before the rollup existed)
+    """
+    try:
+        if session_id is None:
+            row = conn.execute(_SELECT_TOTAL_COUNT_SQL).fetchone()
+        else:
+            row = conn.execute(_SELECT_SESSION_COUNT_SQL, (session_id,)).fetchone()
+        return (row[0] or 0) if row else 0
+    except sqlite3.OperationalError:
+        if session_id is None:
+            return conn.execute('SELECT COUNT(*) FROM sensor_data').fetchone()[0]
+        return conn.execute('SELECT COUNT(*) FROM sensor_data WHERE session_id = ?',
+                            (session_id,)).fetchone()[0]
+
+
 class IoTSensorReader:
     """
     Reads environmental sensor data from Arduino via Serial
@@ -102,9 +206,19 @@ class IoTSensorReader:
         
         # Database logging attributes
         self.db_logging_enabled = False
-        self.db_connection = None
+        self.db_pending_sensors = set()  # Raw keys reported since the last logged reading
+        self.db_record_count = 0  # Rows committed by the writer thread this session
+        self.db_connection = None  # Schema setup and session bookkeeping
+        self.db_reader_local = threading.local()  # Per-thread read connections
+        self.db_reader_connections = []
+        self.db_reader_lock = threading.Lock()
+        self.db_generation = 0  # Bumped per logging session; keys the per-thread read connections
         self.db_file = None
         self.db_session_id = None
+        self.db_write_queue = queue.Queue(maxsize=1024)  # Readings waiting for the writer thread
+        self.db_writer_thread = None
+        self.db_batch_size = 16  # Commit after this many readings...
+        self.db_flush_interval = 5.0  # ...or after this many seconds
         
         # In-memory data buffer for forecasting (works without database logging)
         self.memory_buffer = []  # Rolling buffer of recent readings
@@ -210,7 +324,7 @@ class IoTSensorReader:
                 self.serial_connection = serial.Serial(
                     port=self.port,
                     baudrate=self.baudrate,
-                    timeout=1
+                    timeout=SERIAL_READ_TIMEOUT
                 )
                 time.sleep(2)  # Wait for Arduino to reset
                 self.is_connected = True
@@ -285,23 +399,19 @@ class IoTSensorReader:
         """
         line = line.strip()
         
-        # Parse different sensor formats
-        patterns = {
-            'humidity': r'Humidity:\s*([\d.]+)',
-            'temperature': r'Temperature:\s*([\d.]+)',
-            'light': r'Light:\s*([\d.]+)',
-            'sound': r'Sound:\s*([\d]+)',
-            'gas': r'Gas.*:\s*([\d]+)'
-        }
+        # Every reading has a ':' (banners, blank lines and status messages don't), so
+        # non-data lines are rejected by a C-level substring test before the regex runs
+        if ':' not in line:
+            return None
         
-        for sensor, pattern in patterns.items():
-            match = re.search(pattern, line, re.IGNORECASE)
-            if match:
-                try:
-                    value = float(match.group(1))
-                    return (sensor, value)
-                except ValueError:
-                    pass
+        # Parse different sensor formats
+        match = _SENSOR_LINE_PATTERN.search(line)
+        if match:
+            sensor = match.lastgroup
+            try:
+                return (sensor, float(match.group(sensor)))
+            except ValueError:
+                pass
         
         return None
     
@@ -415,152 +525,284 @@ class IoTSensorReader:
         last_debug_print = time.time()
         db_interval = 1  # Write to database every 1 second
         debug_interval = 10  # Print debug info every 10 seconds
+        rx_buffer = bytearray()  # Received bytes not yet terminated by a newline
+        rx_lines = deque()  # Complete lines split off rx_buffer, not yet processed
         
         while self.is_reading:
             try:
-                if self.serial_connection and self.serial_connection.in_waiting > 0:
-                    line = self.serial_connection.readline().decode('utf-8', errors='ignore')
+                if not rx_lines:
+                    serial_connection = self.serial_connection
+                    if serial_connection is None:
+                        time.sleep(0.1)
+                        continue
                     
-                    # Debug: Print raw line occasionally
-                    current_time = time.time()
-                    if current_time - last_debug_print >= debug_interval:
-                        print(f"[IoT] Raw data sample: {line.strip()}")
-                        last_debug_print = current_time
+                    # Block (up to the read timeout) for the first byte, then take everything
+                    # already buffered in one read and split it into lines
+                    data = serial_connection.read(max(1, serial_connection.in_waiting))
+                    rx_buffer += data
+                    if b'\n' not in data:
+                        del rx_buffer[:-SERIAL_MAX_LINE_BYTES]  # no newline ever: keep the tail only
+                        continue
+                    *complete, rest = rx_buffer.split(b'\n')
+                    rx_buffer = bytearray(rest)
+                    rx_lines.extend(complete)
+                
+                line = rx_lines.popleft().decode('utf-8', errors='ignore')
+                
+                # Debug: Print raw line occasionally
+                current_time = time.time()
+                if current_time - last_debug_print >= debug_interval:
+                    print(f"[IoT] Raw data sample: {line.strip()}")
+                    last_debug_print = current_time
+                
+                # Parse sensor data
+                result = self.parse_sensor_line(line)
+                if result:
+                    sensor_name, value = result
                     
-                    # Parse sensor data
-                    result = self.parse_sensor_line(line)
-                    if result:
-                        sensor_name, value = result
-                        
-                        # Store raw value
-                        self.current_data[f'raw_{sensor_name}'] = value
-                        
-                        # Normalize and store
-                        normalized = self.normalize_value(sensor_name, value)
-                        self.current_data[sensor_name] = normalized
-                        self.current_data['timestamp'] = datetime.now()
-                        
-                        # Apply conversions for sound and gas sensors
-                        if sensor_name == 'sound':
-                            self.current_data['sound_dba'] = getDBA(value)
-                        elif sensor_name == 'gas':
-                            self.current_data['gas_ppm'] = mq135_getPPM(value)
-                        
-                        # Calculate environmental score
-                        env_score = self.calculate_environmental_score()
-                        self.current_data['environmental_score'] = env_score
-                        
-                        # Debug: Print first successful data read
-                        if not hasattr(self, '_first_data_received'):
-                            print(f"[IoT] ✓ First data received: {sensor_name} = {value}")
-                            self._first_data_received = True
-                        
-                        # Add to queue for processing
-                        try:
-                            self.data_queue.put_nowait(self.current_data.copy())
-                        except queue.Full:
-                            pass  # Queue full, skip this reading
-                        
-                        # Update in-memory buffer for forecasting (works without database logging)
-                        # Only add complete readings (all sensors present) every ~10 seconds
-                        required_sensors = ['raw_temperature', 'raw_humidity', 'raw_light', 'raw_sound', 'raw_gas']
-                        if all(self.current_data.get(key) is not None for key in required_sensors):
-                            current_time = time.time()
-                            # Add to buffer every 10 seconds to match expected data rate
-                            if self.last_buffer_update is None or (current_time - self.last_buffer_update) >= 10:
-                                buffer_entry = {
-                                    'timestamp': self.current_data['timestamp'].isoformat(),
-                                    'temperature': round(self.current_data.get('raw_temperature', 0), 1),
-                                    'humidity': round(self.current_data.get('raw_humidity', 0), 1),
-                                    'light': round(self.current_data.get('raw_light', 0), 1),
-                                    'sound': self.current_data.get('raw_sound', 0),
-                                    'gas': self.current_data.get('raw_gas', 0),
-                                    'occupancy': self.current_data.get('occupancy', 0),
-                                    'happy': int(self.current_data.get('happy', 0)),
-                                    'surprise': int(self.current_data.get('surprise', 0)),
-                                    'neutral': int(self.current_data.get('neutral', 0)),
-                                    'sad': int(self.current_data.get('sad', 0)),
-                                    'angry': int(self.current_data.get('angry', 0)),
-                                    'disgust': int(self.current_data.get('disgust', 0)),
-                                    'fear': int(self.current_data.get('fear', 0)),
-                                    'hour': self.current_data['timestamp'].hour,
-                                    'minute': self.current_data['timestamp'].minute,
-                                    'high_engagement': (int(self.current_data.get('happy', 0)) + 
-                                                       int(self.current_data.get('surprise', 0)) + 
-                                                       int(self.current_data.get('neutral', 0))),
-                                    'low_engagement': (int(self.current_data.get('sad', 0)) + 
-                                                      int(self.current_data.get('angry', 0)) + 
-                                                      int(self.current_data.get('disgust', 0)) + 
-                                                      int(self.current_data.get('fear', 0)))
-                                }
-                                self.memory_buffer.append(buffer_entry)
-                                
-                                # Keep buffer at max size (rolling window)
-                                if len(self.memory_buffer) > self.memory_buffer_max_size:
-                                    self.memory_buffer.pop(0)
-                                
-                                self.last_buffer_update = current_time
+                    # Store raw value
+                    self.current_data[f'raw_{sensor_name}'] = value
+                    self.db_pending_sensors.add(f'raw_{sensor_name}')
+                    
+                    # Normalize and store
+                    normalized = self.normalize_value(sensor_name, value)
+                    self.current_data[sensor_name] = normalized
+                    self.current_data['timestamp'] = datetime.now()
+                    
+                    # Apply conversions for sound and gas sensors
+                    if sensor_name == 'sound':
+                        self.current_data['sound_dba'] = getDBA(value)
+                    elif sensor_name == 'gas':
+                        self.current_data['gas_ppm'] = mq135_getPPM(value)
+                    
+                    # Calculate environmental score
+                    env_score = self.calculate_environmental_score()
+                    self.current_data['environmental_score'] = env_score
+                    
+                    # Debug: Print first successful data read
+                    if not hasattr(self, '_first_data_received'):
+                        print(f"[IoT] ✓ First data received: {sensor_name} = {value}")
+                        self._first_data_received = True
+                    
+                    # Add to queue for processing
+                    try:
+                        self.data_queue.put_nowait(self.current_data.copy())
+                    except queue.Full:
+                        pass  # Queue full, skip this reading
+                    
+                    # A reading is complete once every sensor has reported; format its
+                    # timestamp once for both the memory buffer and the database row
+                    complete_reading = all(self.current_data.get(key) is not None for key in REQUIRED_SENSOR_KEYS)
+                    timestamp_iso = self.current_data['timestamp'].isoformat() if complete_reading else None
+                    
+                    # Update in-memory buffer for forecasting (works without database logging)
+                    # Only add complete readings (all sensors present) every ~10 seconds
+                    if complete_reading:
+                        current_time = time.time()
+                        # Add to buffer every 10 seconds to match expected data rate
+                        if self.last_buffer_update is None or (current_time - self.last_buffer_update) >= 10:
+                            buffer_entry = {
+                                'timestamp': timestamp_iso,
+                                'temperature': round(self.current_data.get('raw_temperature', 0), 1),
+                                'humidity': round(self.current_data.get('raw_humidity', 0), 1),
+                                'light': round(self.current_data.get('raw_light', 0), 1),
+                                'sound': self.current_data.get('raw_sound', 0),
+                                'gas': self.current_data.get('raw_gas', 0),
+                                'occupancy': self.current_data.get('occupancy', 0),
+                                'happy': int(self.current_data.get('happy', 0)),
+                                'surprise': int(self.current_data.get('surprise', 0)),
+                                'neutral': int(self.current_data.get('neutral', 0)),
+                                'sad': int(self.current_data.get('sad', 0)),
+                                'angry': int(self.current_data.get('angry', 0)),
+                                'disgust': int(self.current_data.get('disgust', 0)),
+                                'fear': int(self.current_data.get('fear', 0)),
+                                'hour': self.current_data['timestamp'].hour,
+                                'minute': self.current_data['timestamp'].minute,
+                                'high_engagement': (int(self.current_data.get('happy', 0)) + 
+                                                   int(self.current_data.get('surprise', 0)) + 
+                                                   int(self.current_data.get('neutral', 0))),
+                                'low_engagement': (int(self.current_data.get('sad', 0)) + 
+                                                  int(self.current_data.get('angry', 0)) + 
+                                                  int(self.current_data.get('disgust', 0)) + 
+                                                  int(self.current_data.get('fear', 0)))
+                            }
+                            self.memory_buffer.append(buffer_entry)
+                            
+                            # Keep buffer at max size (rolling window)
+                            if len(self.memory_buffer) > self.memory_buffer_max_size:
+                                self.memory_buffer.pop(0)
+                            
+                            self.last_buffer_update = current_time
+                            
+                            if len(self.memory_buffer) <= 25 and len(self.memory_buffer) % 5 == 0:
+                                print(f"[IoT] Memory buffer: {len(self.memory_buffer)}/{self.memory_buffer_max_size} readings (need 20 for forecasting)")
+                    
+                    # Write to SQLite database immediately when we have all sensor readings
+                    if self.db_logging_enabled:
+                        # Check if we have all required sensor data (complete reading from Arduino)
+                        if complete_reading and self.db_pending_sensors.issuperset(REQUIRED_SENSOR_KEYS):
+                            try:
+                                # Hand the row to the writer thread; no disk I/O on the read loop
+                                self.db_write_queue.put_nowait(('reading', (
+                                    timestamp_iso,
+                                    self.db_session_id,
+                                    round(self.current_data.get('raw_temperature', 0), 1),
+                                    round(self.current_data.get('raw_humidity', 0), 1),
+                                    round(self.current_data.get('raw_light', 0), 1),
+                                    self.current_data.get('raw_sound', 0),
+                                    self.current_data.get('raw_gas', 0),
+                                    round(self.current_data.get('environmental_score', 0), 1),
+                                    round(self.current_data.get('temperature', 0), 1),
+                                    round(self.current_data.get('humidity', 0), 1),
+                                    round(self.current_data.get('light', 0), 1),
+                                    round(self.current_data.get('sound', 0), 1),
+                                    round(self.current_data.get('gas', 0), 1),
+                                    self.current_data.get('occupancy', 0),
+                                    int(self.current_data.get('happy', 0)),
+                                    int(self.current_data.get('surprise', 0)),
+                                    int(self.current_data.get('neutral', 0)),
+                                    int(self.current_data.get('sad', 0)),
+                                    int(self.current_data.get('angry', 0)),
+                                    int(self.current_data.get('disgust', 0)),
+                                    int(self.current_data.get('fear', 0))
+                                )))
                                 
-                                if len(self.memory_buffer) <= 25 and len(self.memory_buffer) % 5 == 0:
-                                    print(f"[IoT] Memory buffer: {len(self.memory_buffer)}/{self.memory_buffer_max_size} readings (need 20 for forecasting)")
-                        
-                        # Write to SQLite database immediately when we have all sensor readings
-                        if self.db_logging_enabled:
-                            # Check if we have all required sensor data (complete reading from Arduino)
-                            required_sensors = ['raw_temperature', 'raw_humidity', 'raw_light', 'raw_sound', 'raw_gas']
-                            if all(key in self.current_data for key in required_sensors):
-                                try:
-                                    cursor = self.db_connection.cursor()
-                                    cursor.execute('''
-                                        INSERT INTO sensor_data 
-                                        (timestamp, session_id, temperature, humidity, light, sound, gas, 
-                                         environmental_score, temperature_norm, humidity_norm, light_norm, 
-                                         sound_norm, gas_norm, occupancy, happy, surprise, neutral, sad, angry, disgust, fear)
-                                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                                    ''', (
-                                        self.current_data['timestamp'].isoformat(),
-                                        self.db_session_id,
-                                        round(self.current_data.get('raw_temperature', 0), 1),
-                                        round(self.current_data.get('raw_humidity', 0), 1),
-                                        round(self.current_data.get('raw_light', 0), 1),
-                                        self.current_data.get('raw_sound', 0),
-                                        self.current_data.get('raw_gas', 0),
-                                        round(self.current_data.get('environmental_score', 0), 1),
-                                        round(self.current_data.get('temperature', 0), 1),
-                                        round(self.current_data.get('humidity', 0), 1),
-                                        round(self.current_data.get('light', 0), 1),
-                                        round(self.current_data.get('sound', 0), 1),
-                                        round(self.current_data.get('gas', 0), 1),
-                                        self.current_data.get('occupancy', 0),
-                                        int(self.current_data.get('happy', 0)),
-                                        int(self.current_data.get('surprise', 0)),
-                                        int(self.current_data.get('neutral', 0)),
-                                        int(self.current_data.get('sad', 0)),
-                                        int(self.current_data.get('angry', 0)),
-                                        int(self.current_data.get('disgust', 0)),
-                                        int(self.current_data.get('fear', 0))
-                                    ))
-                                    self.db_connection.commit()
-                                    
-                                    # Get record count
-                                    cursor.execute('SELECT COUNT(*) FROM sensor_data WHERE session_id = ?', 
-                                                 (self.db_session_id,))
-                                    count = cursor.fetchone()[0]
-                                    print(f"[IoT] ✓ Data logged to SQLite at {self.current_data['timestamp'].strftime('%H:%M:%S')} (Record #{count})")
-                                    
-                                    # Clear sensor data after logging to avoid duplicate logs
-                                    for sensor in required_sensors:
-                                        if sensor in self.current_data:
-                                            del self.current_data[sensor]
-                                except Exception as e:
-                                    print(f"[IoT] ✗ Database write error: {e}")
-                
-                time.sleep(0.1)  # Small delay
+                                # Wait for a fresh value from every sensor to avoid duplicate logs
+                                self.db_pending_sensors.clear()
+                            except queue.Full:
+                                print("[IoT] ✗ Database write queue full, dropping reading")
                 
             except Exception as e:
                 print(f"[IoT] Read error: {e}")
                 time.sleep(1)
     
+    def _db_writer_loop(self, write_queue: queue.Queue):
+        """
+        Background thread that owns the write connection to the logging database
+        
+        Readings are committed in one transaction per batch (db_batch_size rows or
+        db_flush_interval seconds); a ('flush', Event) marker commits immediately and
+        sets the event, and a 'stop' marker commits and exits. The WAL is checkpointed
+        every IOT_DB_CHECKPOINT_INTERVAL seconds and once more on exit.
+        
+        Args:
+            write_queue: This session's queue (a new one is made per session, so a
+                         writer that outlived its session never reads the next one's)
+        """
+        conn = None
+        try:
+            conn = sqlite3.connect(self.db_file, isolation_level=None,
+                                   cached_statements=IOT_DB_CACHED_STATEMENTS)
+            self._apply_db_pragmas(conn)
+            
+            rows = []
+            batch_start = 0.0
+            last_checkpoint = time.monotonic()
+            
+            while True:
+                timeout = None
+                if rows:
+                    timeout = max(0.0, self.db_flush_interval - (time.monotonic() - batch_start))
+                try:
+                    kind, row = write_queue.get(timeout=timeout)
+                except queue.Empty:
+                    kind, row = 'flush', None
+                
+                if kind == 'reading':
+                    if not rows:
+                        batch_start = time.monotonic()
+                    rows.append(row)
+                    if len(rows) < self.db_batch_size:
+                        continue
+                
+                if rows:
+                    try:
+                        conn.execute('BEGIN')
+                        conn.executemany(_INSERT_SENSOR_DATA_SQL, rows)
+                        conn.execute('COMMIT')
+                        
+                        self.db_record_count += len(rows)
+                        print(f"[IoT] ✓ {len(rows)} readings logged to SQLite at {rows[-1][0][11:19]} (Record #{self.db_record_count})")
+                    except Exception as e:
+                        if conn.in_transaction:
+                            conn.execute('ROLLBACK')
+                        print(f"[IoT] ✗ Database write error: {e}")
+                    rows = []
+                
+                if kind == 'flush' and row is not None:
+                    row.set()  # Everything queued before the marker is committed (or failed)
+                
+                if kind == 'stop' or time.monotonic() - last_checkpoint >= IOT_DB_CHECKPOINT_INTERVAL:
+                    try:
+                        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                    except sqlite3.Error as e:
+                        print(f"[IoT] ✗ WAL checkpoint error: {e}")
+                    last_checkpoint = time.monotonic()
+                
+                if kind == 'stop':
+                    break
+        except Exception as e:
+            # Readings queued from here on are never committed; flush_db_buffer() reports it
+            print(f"[IoT] ✗ Database writer stopped: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+    
+    def _db_reader(self) -> sqlite3.Connection:
+        """
+        Get this thread's read connection to the current logging database
+        
+        With WAL each request thread reads from its own connection, so reads never
+        queue behind each other or behind the writer thread.
+        """
+        local = self.db_reader_local
+        # Keyed on the session generation, not db_file: a session restarted within the same
+        # second reuses the file name, and its old connection was closed by _close_db_readers
+        if getattr(local, 'generation', None) != self.db_generation:
+            conn = sqlite3.connect(self.db_file, check_same_thread=False,
+                                   cached_statements=IOT_DB_CACHED_STATEMENTS)
+            self._apply_db_pragmas(conn)
+            with self.db_reader_lock:
+                self.db_reader_connections.append(conn)
+            local.conn = conn
+            local.generation = self.db_generation
+        return local.conn
+    
+    def _close_db_readers(self):
+        """Close every thread's read connection (called when a logging session ends)"""
+        with self.db_reader_lock:
+            connections = self.db_reader_connections
+            self.db_reader_connections = []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+    
+    def flush_db_buffer(self, timeout: float = 5.0) -> bool:
+        """
+        Wait until every reading queued so far has been committed to the logging database
+        
+        Readings queued after this call don't delay it (unlike Queue.join()).
+        
+        Args:
+            timeout: Seconds to wait for the writer thread
+        
+        Returns:
+            True if the writer committed the readings in time; False on timeout or if
+            the writer thread died during an active session (its queued readings are lost)
+        """
+        if not self.db_logging_enabled:
+            return True
+        if not (self.db_writer_thread and self.db_writer_thread.is_alive()):
+            return False
+        done = threading.Event()
+        try:
+            self.db_write_queue.put(('flush', done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+    
     def start_reading(self):
         """Start reading sensor data in background thread"""
         if not self.is_connected:
@@ -623,6 +865,19 @@ class IoTSensorReader:
             'data_quality': self.calculate_environmental_score()
         }
     
+    def _apply_db_pragmas(self, conn: sqlite3.Connection):
+        """Configure a logging database connection (safe to run on every open)"""
+        # WAL + NORMAL sync: inserts append to the WAL instead of fsyncing the
+        # main file, and readers (forecast/export) don't block behind the writer
+        if self.db_file != ':memory:':
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA wal_autocheckpoint={IOT_DB_WAL_AUTOCHECKPOINT}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        conn.execute('PRAGMA cache_size=-20000')  # 20 MB page cache
+        conn.execute('PRAGMA busy_timeout=5000')
+        conn.execute(f'PRAGMA mmap_size={IOT_DB_MMAP_SIZE}')
+    
     def start_db_logging(self) -> Dict:
         """Start logging to a new SQLite database and begin sensor data gathering"""
         if self.db_logging_enabled:
@@ -647,9 +902,12 @@ class IoTSensorReader:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             self.db_file = f'data/iot_log_{timestamp}.db'
             self.db_session_id = timestamp
+            self.db_generation += 1  # Invalidates read connections cached by earlier sessions
             
             # Connect to database
-            self.db_connection = sqlite3.connect(self.db_file, check_same_thread=False)
+            self.db_connection = sqlite3.connect(self.db_file, check_same_thread=False,
+                                                 cached_statements=IOT_DB_CACHED_STATEMENTS)
+            self._apply_db_pragmas(self.db_connection)
             cursor = self.db_connection.cursor()
             
             # Create table
@@ -682,10 +940,55 @@ class IoTSensorReader:
             
             # Create index for faster queries
             cursor.execute('CREATE INDEX IF NOT EXISTS idx_timestamp ON sensor_data(timestamp)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_session ON sensor_data(session_id)')
+            # (session_id, timestamp) serves both the per-session COUNT and the
+            # newest-N / chronological scans without a sort step
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_session_timestamp ON sensor_data(session_id, timestamp)')
+            
+            # Per-session rollup kept current by a trigger, so record counts and
+            # session aggregates are a primary-key lookup instead of a table scan
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS session_summary (
+                    session_id TEXT PRIMARY KEY,
+                    record_count INTEGER NOT NULL DEFAULT 0,
+                    first_timestamp TEXT,
+                    last_timestamp TEXT,
+                    sum_occupancy INTEGER DEFAULT 0,
+                    max_occupancy INTEGER DEFAULT 0,
+                    sum_high_engagement INTEGER DEFAULT 0,
+                    sum_low_engagement INTEGER DEFAULT 0
+                )
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS trg_session_summary AFTER INSERT ON sensor_data
+                BEGIN
+                    INSERT INTO session_summary
+                    (session_id, record_count, first_timestamp, last_timestamp, sum_occupancy,
+                     max_occupancy, sum_high_engagement, sum_low_engagement)
+                    VALUES (NEW.session_id, 1, NEW.timestamp, NEW.timestamp, COALESCE(NEW.occupancy, 0),
+                            COALESCE(NEW.occupancy, 0),
+                            COALESCE(NEW.happy, 0) + COALESCE(NEW.surprise, 0) + COALESCE(NEW.neutral, 0),
+                            COALESCE(NEW.sad, 0) + COALESCE(NEW.angry, 0) + COALESCE(NEW.disgust, 0) + COALESCE(NEW.fear, 0))
+                    ON CONFLICT(session_id) DO UPDATE SET
+                        record_count = record_count + 1,
+                        last_timestamp = excluded.last_timestamp,
+                        sum_occupancy = sum_occupancy + excluded.sum_occupancy,
+                        max_occupancy = MAX(max_occupancy, excluded.max_occupancy),
+                        sum_high_engagement = sum_high_engagement + excluded.sum_high_engagement,
+                        sum_low_engagement = sum_low_engagement + excluded.sum_low_engagement;
+                END
+            ''')
             
             self.db_connection.commit()
             
+            # Writes go through a dedicated writer thread/connection; db_connection serves reads
+            self.db_record_count = 0
+            # Fresh queue: a 'stop' marker left behind by a writer that timed out must not
+            # end this session's writer
+            self.db_write_queue = queue.Queue(maxsize=1024)
+            self.db_writer_thread = threading.Thread(target=self._db_writer_loop,
+                                                     args=(self.db_write_queue,), daemon=True)
+            self.db_writer_thread.start()
+            
             self.db_logging_enabled = True
             
             # Start sensor reading thread if not already running
@@ -725,11 +1028,25 @@ class IoTSensorReader:
                     self.reading_thread.join(timeout=2)
                 print(f"[IoT] ✓ Sensor data gathering stopped")
             
+            # Commit any queued readings and stop the writer thread
+            if self.db_writer_thread:
+                if self.db_writer_thread.is_alive():
+                    try:
+                        self.db_write_queue.put(('stop', None), timeout=5)
+                    except queue.Full:
+                        print(f"[IoT] ⚠ Database writer is not draining its queue; abandoning it")
+                    self.db_writer_thread.join(timeout=5)
+                self.db_writer_thread = None
+            
+            self._close_db_readers()
+            
             if self.db_connection:
                 # Get final record count
                 cursor = self.db_connection.cursor()
-                cursor.execute('SELECT COUNT(*) FROM sensor_data WHERE session_id = ?', (self.db_session_id,))
-                record_count = cursor.fetchone()[0]
+                record_count = get_session_record_count(self.db_connection, self.db_session_id)
+                
+                # Refresh planner statistics now that the session's data is complete
+                cursor.execute('PRAGMA optimize')
                 
                 self.db_connection.close()
                 self.db_connection = None
@@ -765,24 +1082,13 @@ class IoTSensorReader:
                 'record_count': 0
             }
         
-        try:
-            cursor = self.db_connection.cursor()
-            cursor.execute('SELECT COUNT(*) FROM sensor_data WHERE session_id = ?', (self.db_session_id,))
-            record_count = cursor.fetchone()[0]
-            
-            return {
-                'enabled': True,
-                'db_file': self.db_file,
-                'session_id': self.db_session_id,
-                'record_count': record_count
-            }
-        except:
-            return {
-                'enabled': True,
-                'db_file': self.db_file,
-                'session_id': self.db_session_id,
-                'record_count': 0
-            }
+        # The writer thread keeps the committed row count, so status polls need no query
+        return {
+            'enabled': True,
+            'db_file': self.db_file,
+            'session_id': self.db_session_id,
+            'record_count': self.db_record_count
+        }
     
     def get_recent_data(self, limit: int = 30) -> List[Dict]:
         """
@@ -793,42 +1099,16 @@ class IoTSensorReader:
         # First, try to use database if logging is enabled
         if self.db_logging_enabled and self.db_connection:
             try:
-                cursor = self.db_connection.cursor()
-                cursor.execute('''
-                    SELECT timestamp, temperature, humidity, light, sound, gas,
-                           occupancy, happy, surprise, neutral, sad, angry, disgust, fear
-                    FROM sensor_data
-                    WHERE session_id = ?
-                    ORDER BY timestamp DESC
-                    LIMIT ?
-                ''', (self.db_session_id, limit))
+                if not self.flush_db_buffer():
+                    # Some readings never reached the database; the memory buffer has them
+                    raise RuntimeError('database writer is not committing readings')
+                cursor = self._db_reader().cursor()
+                # Time features and engagement groups are computed by SQLite and the
+                # newest-N window is re-sorted chronologically in the same query
+                cursor.execute(_SELECT_RECENT_DATA_SQL, (self.db_session_id, limit))
                 
-                rows = cursor.fetchall()
-                
-                # Convert to list of dicts (reverse to chronological order)
-                data = []
-                for row in reversed(rows):
-                    data.append({
-                        'timestamp': row[0],
-                        'temperature': row[1],
-                        'humidity': row[2],
-                        'light': row[3],
-                        'sound': row[4],
-                        'gas': row[5],
-                        'occupancy': row[6],
-                        'happy': row[7],
-                        'surprise': row[8],
-                        'neutral': row[9],
-                        'sad': row[10],
-                        'angry': row[11],
-                        'disgust': row[12],
-                        'fear': row[13],
-                        # Add time features for model
-                        'hour': datetime.fromisoformat(row[0]).hour if row[0] else 0,
-                        'minute': datetime.fromisoformat(row[0]).minute if row[0] else 0,
-                        'high_engagement': (row[7] or 0) + (row[8] or 0) + (row[9] or 0),
-                        'low_engagement': (row[10] or 0) + (row[11] or 0) + (row[12] or 0) + (row[13] or 0)
-                    })
+                columns = [col[0] for col in cursor.description]
+                data = [dict(zip(columns, row)) for row in cursor.fetchall()]
                 
                 return data
                 
@@ -867,34 +1147,33 @@ class IoTSensorReader:
             if not output_file:
                 output_file = self.db_file.replace('.db', '.csv')
             
-            # Query all data
-            cursor = self.db_connection.cursor()
-            cursor.execute('''
-                SELECT timestamp, temperature, humidity, light, sound, gas, 
-                       environmental_score, occupancy, happy, surprise, neutral, 
-                       sad, angry, disgust, fear
-                FROM sensor_data
-                WHERE session_id = ?
-                ORDER BY timestamp
-            ''', (self.db_session_id,))
-            
-            rows = cursor.fetchall()
+            # Query all data (including readings still in the batch buffer)
+            if not self.flush_db_buffer():
+                print(f"[IoT] ⚠ Database writer is not committing readings; the export may be incomplete")
+            cursor = self._db_reader().cursor()
+            cursor.execute(_SELECT_EXPORT_DATA_SQL, (self.db_session_id,))
             
-            # Write to CSV
+            # Write to CSV, streaming rows in chunks so long sessions are never held in memory at once
+            record_count = 0
             with open(output_file, 'w', newline='') as f:
                 writer = csv.writer(f)
                 writer.writerow(['timestamp', 'temperature', 'humidity', 'light', 'sound', 'gas', 
                                'environmental_score', 'occupancy', 'happy', 'surprise', 'neutral', 
                                'sad', 'angry', 'disgust', 'fear'])
-                writer.writerows(rows)
+                while True:
+                    rows = cursor.fetchmany(512)
+                    if not rows:
+                        break
+                    writer.writerows(rows)
+                    record_count += len(rows)
             
-            print(f"[IoT] ✓ Exported {len(rows)} records to {output_file}")
+            print(f"[IoT] ✓ Exported {record_count} records to {output_file}")
             
             return {
                 'success': True,
-                'message': f'Exported {len(rows)} records',
+                'message': f'Exported {record_count} records',
                 'csv_file': output_file,
-                'record_count': len(rows)
+                'record_count': record_count
             }
             
         except Exception as e:
@@ -7,8 +7,17 @@ import tensorflow as tf
 from tensorflow import keras
 import numpy as np
 import cv2
-from typing import Tuple, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Dict, List, Optional
+import functools
 import os
+import threading
+
+# Prefer the standalone TFLite runtime when installed; tf.lite ships the same interpreter
+try:
+    from tflite_runtime.interpreter import Interpreter as TFLiteInterpreter
+except ImportError:
+    TFLiteInterpreter = tf.lite.Interpreter
 
 
 class KerasEmotionDetector:
@@ -31,19 +40,49 @@ class KerasEmotionDetector:
         'Fear': 'Confused'
     }
     
-    def __init__(self, model_path='static/model/emotion_model_combined.h5'):
+    # Engagement state per label index (aligned with EMOTION_LABELS) for the post-argmax lookup
+    IDX_TO_ENGAGEMENT = tuple(map(EMOTION_TO_ENGAGEMENT.get, EMOTION_LABELS))
+    
+    # Faces per model call when a batch is pipelined (preprocess chunk k+1 while chunk k runs)
+    PIPELINE_CHUNK = 8
+    
+    def __init__(self, model_path='static/model/emotion_model_combined.h5', use_tflite: bool = True,
+                 calibration_faces: Optional[List[np.ndarray]] = None):
         """
         Initialize Keras emotion detector
         
         Args:
             model_path: Path to complete trained model (.h5 file)
+            use_tflite: Run inference through an FP16 TFLite conversion of the model
+            calibration_faces: BGR face crops (~100) used to calibrate an INT8 TFLite
+                               conversion instead of FP16; only used with use_tflite
         """
         self.model_path = model_path
+        self.calibration_faces = calibration_faces
+        self.tflite_precision = 'int8' if calibration_faces else 'fp16'
         self.model = None
+        self.interpreter = None  # TFLite interpreter (used instead of the Keras model when loaded)
+        self._interpreter_lock = threading.Lock()
+        self._single_interpreter = None  # Batch-1 twin of the interpreter for single-face calls
+        self._single_lock = threading.Lock()
+        self._infer = None  # Concrete tf.function over the Keras model (used when TFLite is off)
+        self._preprocess_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='keras-preprocess')
         self.emotion_labels = self.EMOTION_LABELS
         self.input_shape = None  # Will be set after loading
         
-        self._load_model()
+        # The Keras model is only loaded when there is no fresh TFLite file to run instead
+        if use_tflite:
+            self._load_tflite_model()
+        if self.interpreter is None:
+            if self.model is None:
+                self._load_model()
+            if self.model is not None:
+                self._build_infer_function()
+    
+    @property
+    def is_loaded(self) -> bool:
+        """True when either the TFLite interpreter or the Keras model is ready for inference"""
+        return self.interpreter is not None or self.model is not None
     
     def _load_model(self):
         """Load complete Keras model from .h5 file"""
@@ -70,45 +109,160 @@ class KerasEmotionDetector:
             traceback.print_exc()
             self.model = None
     
-    def _preprocess_image(self, face_image):
+    def _load_tflite_model(self):
+        """
+        Convert the Keras model to a TFLite flatbuffer (cached next to the .h5) and load it
+        
+        FP16 weights by default; with calibration faces, full INT8 weights and activations
+        (float input/output kept, so _run_model is unchanged). The Keras model is loaded
+        only to (re)convert and is released once the interpreter is up.
+        """
+        precision = self.tflite_precision
+        try:
+            tflite_path = os.path.splitext(self.model_path)[0] + f'.{precision}.tflite'
+            
+            if (not os.path.exists(tflite_path) or
+                    os.path.getmtime(tflite_path) < os.path.getmtime(self.model_path)):
+                self._load_model()
+                if self.model is None:
+                    return
+                print(f"[Keras] Converting model to TFLite {precision.upper()}...")
+                converter = tf.lite.TFLiteConverter.from_keras_model(self.model)
+                converter.optimizations = [tf.lite.Optimize.DEFAULT]
+                if precision == 'int8':
+                    converter.representative_dataset = self._representative_dataset
+                else:
+                    converter.target_spec.supported_types = [tf.float16]
+                with open(tflite_path, 'wb') as f:
+                    f.write(converter.convert())
+            
+            self.interpreter = TFLiteInterpreter(model_path=tflite_path, num_threads=os.cpu_count())
+            self.interpreter.allocate_tensors()
+            self._tflite_input = self.interpreter.get_input_details()[0]['index']
+            self._tflite_output = self.interpreter.get_output_details()[0]['index']
+            self._tflite_batch = 1
+            self.input_shape = tuple(self.interpreter.get_input_details()[0]['shape'][1:3])
+            
+            # Single faces get their own batch-1 interpreter, so alternating 1-face and
+            # multi-face frames never resizes (and reallocates) either one
+            self._single_interpreter = TFLiteInterpreter(model_path=tflite_path, num_threads=os.cpu_count())
+            self._single_interpreter.allocate_tensors()
+            
+            # Inference runs on the interpreter; don't keep the Keras graph and weights resident
+            self.model = None
+            keras.backend.clear_session()
+            
+            print(f"✓ TFLite {precision.upper()} model loaded: {tflite_path}")
+            
+        except Exception as e:
+            print(f"[Keras] TFLite unavailable, using the Keras model: {e}")
+            self.interpreter = None
+            self._single_interpreter = None
+    
+    def _representative_dataset(self):
+        """Yield preprocessed calibration faces one at a time for INT8 conversion"""
+        for face in self.calibration_faces:
+            yield [self._preprocess_image(face)]
+    
+    def _build_infer_function(self):
+        """
+        Trace the Keras model once into a concrete graph function (skips Model.predict's per-call setup)
+        
+        XLA-compiled when possible so the small-batch graph runs as a few fused kernels;
+        a dummy batch is pushed through at load so compilation isn't paid on the first frame.
+        """
+        signature = tf.TensorSpec([None, *self.input_shape, 3], tf.float32)
+        dummy = tf.zeros([1, *self.input_shape, 3], tf.float32)
+        
+        for jit_compile in (True, False):
+            try:
+                infer = tf.function(
+                    lambda x: self.model(x, training=False),
+                    input_signature=[signature],
+                    jit_compile=jit_compile
+                ).get_concrete_function()
+                infer(dummy)  # warm-up (triggers XLA compilation)
+                self._infer = infer
+                print(f"✓ Keras inference function ready ({'XLA' if jit_compile else 'graph'})")
+                return
+                
+            except Exception as e:
+                print(f"[Keras] {'XLA' if jit_compile else 'tf.function'} unavailable: {e}")
+        
+        print("[Keras] Calling the Keras model directly")
+        self._infer = None
+    
+    def _run_model(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Run the emotion model on a preprocessed (N, H, W, 3) float32 batch
+        
+        Returns:
+            (N, 7) array of emotion probabilities
+        """
+        if self.interpreter is None:
+            if self._infer is not None:
+                return self._infer(tf.constant(batch)).numpy()
+            # Direct __call__ skips predict()'s per-call data adapter and callback setup
+            return self.model(batch, training=False).numpy()
+        
+        if batch.shape[0] == 1 and self._single_interpreter is not None:
+            with self._single_lock:
+                self._single_interpreter.set_tensor(self._tflite_input, batch)
+                self._single_interpreter.invoke()
+                return self._single_interpreter.get_tensor(self._tflite_output).copy()
+        
+        # The interpreter is stateful, so one batch at a time
+        with self._interpreter_lock:
+            if batch.shape[0] != self._tflite_batch:
+                self.interpreter.resize_tensor_input(self._tflite_input, batch.shape)
+                self.interpreter.allocate_tensors()
+                self._tflite_batch = batch.shape[0]
+            
+            self.interpreter.set_tensor(self._tflite_input, batch)
+            self.interpreter.invoke()
+            return self.interpreter.get_tensor(self._tflite_output).copy()
+    
+    def _preprocess_image(self, face_image, out=None):
         """
         Preprocess face image for model input
         
         Args:
             face_image: Face image in BGR format (from OpenCV)
+            out: Optional (48, 48, 3) float32 slot (e.g. one row of a batch) to write into
             
         Returns:
-            Preprocessed image tensor
+            Preprocessed image tensor ((1, 48, 48, 3), or `out` when given)
         """
-        # Resize to model input size (48x48)
+        # Resize to model input size (48x48) first so the color conversion runs on 48x48
         resized = cv2.resize(face_image, (48, 48))
         
         # Model expects RGB, convert from BGR
         rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
         
-        # Normalize to [0, 1]
-        normalized = rgb.astype('float32') / 255.0
+        # Normalize to [0, 1] in a single float32 pass
+        if out is not None:
+            return np.multiply(rgb, np.float32(1.0 / 255.0), out=out)
         
         # Add batch dimension
-        tensor = np.expand_dims(normalized, axis=0)
-        
-        return tensor
+        return np.multiply(rgb[np.newaxis], np.float32(1.0 / 255.0), dtype=np.float32)
     
-    def predict_emotion(self, face_image) -> Tuple[str, str, float, Dict[str, float]]:
+    def predict_emotion(self, face_image,
+                        return_all_probs: bool = True) -> Tuple[str, str, float, Optional[Dict[str, float]]]:
         """
         Predict emotion from face image
         
         Args:
             face_image: Face image in BGR format (from OpenCV)
+            return_all_probs: Build all_predictions; pass False when only the top emotion is used
             
         Returns:
             Tuple of:
             - raw_emotion: Raw FER-2013 emotion label
             - engagement_state: Mapped engagement state
             - confidence: Prediction confidence (0-1)
-            - all_predictions: Dictionary of all emotion probabilities
+            - all_predictions: Dictionary of all emotion probabilities (None if not requested)
         """
-        if self.model is None:
+        if not self.is_loaded:
             print("[Keras] WARNING: Model is None! Returning default Neutral.")
             return 'Neutral', 'Engaged', 0.0, {label: 0.0 for label in self.EMOTION_LABELS}
         
@@ -117,21 +271,18 @@ class KerasEmotionDetector:
             tensor = self._preprocess_image(face_image)
             
             # Predict
-            predictions = self.model.predict(tensor, verbose=0)[0]
+            predictions = self._run_model(tensor)[0]
             
             # Get top prediction
-            predicted_idx = np.argmax(predictions)
+            predicted_idx = int(np.argmax(predictions))
             confidence = float(predictions[predicted_idx])
             raw_emotion = self.EMOTION_LABELS[predicted_idx]
             
             # Build predictions dict
-            all_predictions = {
-                label: float(prob)
-                for label, prob in zip(self.EMOTION_LABELS, predictions)
-            }
+            all_predictions = dict(zip(self.EMOTION_LABELS, predictions.tolist())) if return_all_probs else None
             
             # Map to engagement state
-            engagement_state = self.EMOTION_TO_ENGAGEMENT.get(raw_emotion, 'Engaged')
+            engagement_state = self.IDX_TO_ENGAGEMENT[predicted_idx]
             
             return raw_emotion, engagement_state, confidence, all_predictions
             
@@ -141,39 +292,74 @@ class KerasEmotionDetector:
             traceback.print_exc()
             return 'Neutral', 'Engaged', 0.0, {label: 0.0 for label in self.EMOTION_LABELS}
     
-    def predict_batch(self, face_images):
+    def _predict_pipelined(self, face_images) -> np.ndarray:
+        """
+        Preprocess and run a batch, overlapping preprocessing with inference for large batches
+        
+        A single face runs as one batch-1 call. Anything larger is zero-padded to a
+        multiple of PIPELINE_CHUNK and run in PIPELINE_CHUNK-sized calls, so the
+        interpreter keeps one input shape and never reallocates as the face count
+        changes; while one chunk runs, a worker thread preprocesses the next (both cv2
+        and the interpreter release the GIL, so the two stages run in parallel).
+        
+        Returns:
+            (N, 7) array of emotion probabilities
+        """
+        n = len(face_images)
+        chunk = self.PIPELINE_CHUNK
+        
+        def preprocess(start):
+            for i in range(start, min(start + chunk, n)):
+                self._preprocess_image(face_images[i], out=batch_tensor[i])
+        
+        if n == 1:
+            # Batch-1 calls go to the dedicated single-face interpreter
+            batch_tensor = np.empty((1, 48, 48, 3), dtype=np.float32)
+            preprocess(0)
+            return self._run_model(batch_tensor)
+        
+        padded = -(-n // chunk) * chunk
+        batch_tensor = np.zeros((padded, 48, 48, 3), dtype=np.float32)
+        preprocess(0)
+        
+        outputs = []
+        for start in range(0, padded, chunk):
+            pending = self._preprocess_pool.submit(preprocess, start + chunk) if start + chunk < n else None
+            outputs.append(self._run_model(batch_tensor[start:start + chunk]))
+            if pending is not None:
+                pending.result()
+        
+        return np.concatenate(outputs)[:n]
+    
+    def predict_batch(self, face_images, return_all_probs: bool = True):
         """
         Predict emotions for multiple faces at once (batch processing)
         
         Args:
             face_images: List of face images in BGR format
+            return_all_probs: Build all_predictions; pass False when only the top emotion is used
             
         Returns:
-            List of tuples (raw_emotion, engagement_state, confidence, all_predictions)
+            List of tuples (raw_emotion, engagement_state, confidence, all_predictions);
+            all_predictions is None when return_all_probs is False
         """
-        if self.model is None or len(face_images) == 0:
+        if not self.is_loaded or len(face_images) == 0:
             return []
         
         try:
-            # Preprocess all images
-            tensors = [self._preprocess_image(img) for img in face_images]
-            batch_tensor = np.vstack(tensors)
+            predictions = self._predict_pipelined(face_images)
             
-            # Batch predict
-            predictions = self.model.predict(batch_tensor, verbose=0)
+            # Top prediction per face, vectorized
+            predicted_indices = predictions.argmax(axis=1)
+            confidences = predictions[np.arange(len(predictions)), predicted_indices]
             
             # Process results
             results = []
-            for i in range(len(face_images)):
-                predicted_idx = np.argmax(predictions[i])
-                confidence = float(predictions[i][predicted_idx])
+            rows = predictions.tolist() if return_all_probs else [None] * len(predictions)
+            for predicted_idx, confidence, probs in zip(predicted_indices.tolist(), confidences.tolist(), rows):
                 raw_emotion = self.EMOTION_LABELS[predicted_idx]
-                engagement_state = self.EMOTION_TO_ENGAGEMENT.get(raw_emotion, 'Engaged')
-                
-                all_predictions = {
-                    label: float(prob)
-                    for label, prob in zip(self.EMOTION_LABELS, predictions[i])
-                }
+                engagement_state = self.IDX_TO_ENGAGEMENT[predicted_idx]
+                all_predictions = dict(zip(self.EMOTION_LABELS, probs)) if probs is not None else None
                 
                 results.append((raw_emotion, engagement_state, confidence, all_predictions))
             
@@ -189,20 +375,37 @@ class KerasEmotionDetector:
             'model_type': 'Keras Custom CNN',
             'model_path': self.model_path,
             'framework': 'TensorFlow/Keras',
+            'runtime': f'TFLite {self.tflite_precision.upper()}' if self.interpreter is not None else 'Keras',
             'emotion_classes': len(self.EMOTION_LABELS),
             'emotion_labels': self.EMOTION_LABELS,
             'input_size': (48, 48),
             'input_channels': 1,  # Grayscale
-            'is_loaded': self.model is not None
+            'is_loaded': self.is_loaded
         }
     
     def __repr__(self):
         """String representation"""
         return (f"KerasEmotionDetector("
-                f"model_loaded={self.model is not None}, "
+                f"model_loaded={self.is_loaded}, "
                 f"emotions={len(self.EMOTION_LABELS)})")
 
 
+@functools.lru_cache(maxsize=1)
+def get_keras_detector(model_path: str = 'static/model/emotion_model_combined.h5',
+                       use_tflite: bool = True) -> KerasEmotionDetector:
+    """
+    Get the process-wide Keras emotion detector, loading the model on first use
+    
+    Args:
+        model_path: Path to complete trained model (.h5 file)
+        use_tflite: Run inference through an FP16 TFLite conversion of the model
+        
+    Returns:
+        Shared KerasEmotionDetector (the same instance for repeated calls with the same arguments)
+    """
+    return KerasEmotionDetector(model_path=model_path, use_tflite=use_tflite)
+
+
 # Test function
 def test_detector():
     """Test the Keras detector with a sample image"""
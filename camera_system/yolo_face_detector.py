@@ -22,20 +22,35 @@ class YOLOFaceDetector:
     Detects faces in video frames to count number of students
     """
     
-    def __init__(self, model_path='static/model/best_yolo11_face.pt'):
+    def __init__(self, model_path='static/model/best_yolo11_face.pt', use_tensorrt: bool = True):
         """
         Initialize YOLO face detector
         
         Args:
             model_path: Path to YOLO11 face detection model
+            use_tensorrt: Prefer a TensorRT engine next to the model (<model>.engine, see
+                          export_tensorrt) when one exists; falls back to the .pt model
         """
         self.model_path = model_path
         self.model = None
         self.is_loaded = False
+        self.runtime = 'pytorch'
         
         if not YOLO_AVAILABLE:
             print("[YOLO] ultralytics package not available")
             return
+        
+        # TensorRT FP16 engine (fused layers, tensor cores) when it has been exported on this GPU
+        engine_path = os.path.splitext(model_path)[0] + '.engine'
+        if use_tensorrt and os.path.exists(engine_path):
+            try:
+                self.model = YOLO(engine_path, task='detect')
+                self.is_loaded = True
+                self.runtime = 'tensorrt'
+                print(f"[YOLO] ✓ Face detection TensorRT engine loaded: {engine_path}")
+                return
+            except Exception as e:
+                print(f"[YOLO] ⚠ Could not load TensorRT engine, using PyTorch model: {e}")
             
         # Load model
         if os.path.exists(model_path):
@@ -139,3 +154,26 @@ class YOLOFaceDetector:
         """
         _, count = self.detect_faces(frame, conf_threshold)
         return count
+
+
+def export_tensorrt(model_path: str = 'static/model/best_yolo11_face.pt', imgsz: int = 640) -> str:
+    """
+    Build a TensorRT FP16 engine for the face model (ONNX export + trtexec-equivalent build)
+    
+    The engine is written next to the model as <model>.engine, where YOLOFaceDetector picks
+    it up. Engines are specific to the GPU and TensorRT version they were built with, so run
+    this on the deployment machine.
+    
+    Args:
+        model_path: Path to the YOLO11 face detection model (.pt)
+        imgsz: Square input size the engine is built for (frames are letterboxed to it)
+        
+    Returns:
+        Path to the exported engine
+    """
+    if not YOLO_AVAILABLE:
+        raise RuntimeError("ultralytics package not available")
+    
+    engine_path = YOLO(model_path).export(format='engine', half=True, imgsz=imgsz, device=0)
+    print(f"[YOLO] ✓ TensorRT engine exported: {engine_path}")
+    return engine_path